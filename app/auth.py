@@ -1,21 +1,135 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Any, Callable
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRES_MINUTES = 60 * 8
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = 2048
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = max(1, int(os.getenv("PASSWORD_HASH_WORKERS", "2")))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_BCRYPT_ROUNDS
+)
+
+
+class AuthError(Exception):
+    pass
+
+
+class PasswordQueueFull(AuthError):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a few dedicated threads instead of the request pool.
+
+    At most ``workers`` hashes run at once and ``queue_limit`` wait behind
+    them; past that, calls fail fast with ``PasswordQueueFull`` so a login
+    burst cannot hold every request worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+    ) -> None:
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _started(self) -> None:
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+
+    def _finished(self, future: Future) -> None:
+        with self.lock:
+            if future.cancelled():
+                self.queued -= 1
+            else:
+                self.running -= 1
+                self.completed += 1
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> Future:
+        with self.lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                raise PasswordQueueFull("Trop de connexions en cours, réessayez dans un instant.")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def run() -> Any:
+            self._started()
+            return func(*args)
+
+        future = self.executor.submit(run)
+        future.add_done_callback(self._finished)
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.submit(pwd_context.hash, password).result()
+
+    def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        return self.submit(pwd_context.verify_and_update, password, hashed_password).result()
+
+    async def verify_and_update_async(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify without blocking the caller; the new hash is set when the
+        stored one does not match the configured scheme or cost."""
+        verified, new_hash = await asyncio.wrap_future(
+            self.submit(pwd_context.verify_and_update, password, hashed_password)
+        )
+        if verified and new_hash:
+            with self.lock:
+                self.rehashed += 1
+        return verified, new_hash
+
+    def metrics(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "queued": self.queued,
+                "running": self.running,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+            }
+
+
+password_hasher = PasswordHasher()
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+    verified, _new_hash = password_hasher.verify_and_update(password, hashed_password)
+    return verified
 
 
 def create_access_token(username: str, role: str) -> str:
@@ -28,12 +142,71 @@ def decode_token(token: str) -> dict:
     return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
 
 
-class AuthError(Exception):
-    pass
-
-
 def get_token_data(token: str) -> dict:
     try:
         return decode_token(token)
     except JWTError as exc:
         raise AuthError("Token invalide") from exc
+
+
+class PrincipalCache:
+    """Token -> user columns, kept a few seconds to skip decode and lookup.
+
+    Entries never outlive the token itself. Routes that change a user call
+    ``evict_user``; other workers catch up when the TTL runs out.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = PRINCIPAL_CACHE_TTL_SECONDS,
+        max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: dict[str, tuple[float, str, dict[str, Any]]] = {}
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        expires_at, _username, principal = entry
+        if expires_at <= time.monotonic():
+            with self.lock:
+                self.entries.pop(token, None)
+            return None
+        return principal
+
+    def put(
+        self,
+        token: str,
+        username: str,
+        principal: dict[str, Any],
+        token_expires: float | None = None,
+    ) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        ttl = float(self.ttl_seconds)
+        if token_expires is not None:
+            ttl = min(ttl, token_expires - time.time())
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {
+                    key: entry for key, entry in self.entries.items() if entry[0] > now
+                }
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()
+            self.entries[token] = (now + ttl, username, principal)
+
+    def evict_user(self, username: str) -> None:
+        with self.lock:
+            self.entries = {
+                key: entry for key, entry in self.entries.items() if entry[1] != username
+            }
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
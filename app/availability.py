@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import secrets
+import threading
+from typing import Any, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.catalog import CatalogSnapshot
+from app.models import AppSetting, LotReservation, TemplateReservation
+
+RESERVATIONS_VERSION_KEY = "reservations_version"
+
+
+@dataclass(frozen=True)
+class Interval:
+    starts_at: datetime
+    ends_at: datetime
+    reserved_items: str | None = None
+    quantity: int = 0
+
+
+class IntervalIndex:
+    """Intervals sorted by start, answering overlap queries by bisection.
+
+    Only intervals starting after ``start - longest interval`` can still be
+    running at ``start``, which bounds the slice scanned for each query.
+    """
+
+    def __init__(self, intervals: Iterable[Interval]) -> None:
+        self.intervals = sorted(intervals, key=lambda item: (item.starts_at, item.ends_at))
+        self.starts = [item.starts_at for item in self.intervals]
+        self.longest = max(
+            (item.ends_at - item.starts_at for item in self.intervals),
+            default=timedelta(0),
+        )
+
+    def overlapping(self, starts_at: datetime, ends_at: datetime) -> list[Interval]:
+        low = bisect_right(self.starts, starts_at - self.longest)
+        high = bisect_left(self.starts, ends_at)
+        return [item for item in self.intervals[low:high] if item.ends_at > starts_at]
+
+
+@dataclass
+class AvailabilitySnapshot:
+    version: str
+    lots: dict[int, IntervalIndex]
+    templates: dict[int, IntervalIndex]
+
+
+def read_reservations_version(db: Session) -> str:
+    setting = db.get(AppSetting, RESERVATIONS_VERSION_KEY)
+    return setting.value if setting else ""
+
+
+def bump_reservations_version(db: Session) -> None:
+    """Mark reservations as changed; commits with the caller's transaction."""
+    db.merge(AppSetting(key=RESERVATIONS_VERSION_KEY, value=secrets.token_hex(8)))
+
+
+def build_availability_snapshot(db: Session, version: str) -> AvailabilitySnapshot:
+    lot_intervals: dict[int, list[Interval]] = defaultdict(list)
+    for row in db.execute(
+        select(
+            LotReservation.lot_id,
+            LotReservation.starts_at,
+            LotReservation.ends_at,
+            LotReservation.reserved_items,
+        )
+    ):
+        lot_intervals[row.lot_id].append(
+            Interval(row.starts_at, row.ends_at, reserved_items=row.reserved_items)
+        )
+    template_intervals: dict[int, list[Interval]] = defaultdict(list)
+    for row in db.execute(
+        select(
+            TemplateReservation.template_id,
+            TemplateReservation.starts_at,
+            TemplateReservation.ends_at,
+            TemplateReservation.quantity,
+        )
+    ):
+        template_intervals[row.template_id].append(
+            Interval(row.starts_at, row.ends_at, quantity=row.quantity)
+        )
+    return AvailabilitySnapshot(
+        version=version,
+        lots={lot_id: IntervalIndex(items) for lot_id, items in lot_intervals.items()},
+        templates={
+            template_id: IntervalIndex(items)
+            for template_id, items in template_intervals.items()
+        },
+    )
+
+
+def template_capacity(template: Any) -> int:
+    if template.node_type == "item" and template.expected_qty:
+        return template.expected_qty
+    return 1
+
+
+def window_availability(
+    snapshot: AvailabilitySnapshot,
+    catalog: CatalogSnapshot,
+    starts_at: datetime,
+    ends_at: datetime,
+) -> dict[str, Any]:
+    """Lots and root templates availability over one time window."""
+    empty = IntervalIndex([])
+    unavailable_lots = []
+    full_reserved_template_ids: set[int] = set()
+    for lot in catalog.lots:
+        conflicts = snapshot.lots.get(lot.id, empty).overlapping(starts_at, ends_at)
+        if not conflicts:
+            continue
+        if any(item.reserved_items is None for item in conflicts):
+            full_reserved_template_ids.update(lot.template_ids)
+        unavailable_lots.append(
+            {
+                "id": lot.id,
+                "name": lot.name,
+                "template_ids": lot.template_ids,
+                "reservations": [
+                    {
+                        "starts_at": item.starts_at.isoformat(timespec="minutes"),
+                        "ends_at": item.ends_at.isoformat(timespec="minutes"),
+                        "reserved_items": item.reserved_items,
+                    }
+                    for item in conflicts
+                ],
+            }
+        )
+    template_availability = []
+    for template in catalog.templates:
+        capacity = template_capacity(template)
+        reserved = sum(
+            item.quantity
+            for item in snapshot.templates.get(template.id, empty).overlapping(
+                starts_at, ends_at
+            )
+        )
+        remaining = 0 if template.id in full_reserved_template_ids else capacity - reserved
+        template_availability.append(
+            {
+                "id": template.id,
+                "capacity": capacity,
+                "reserved": reserved,
+                "remaining": max(0, remaining),
+            }
+        )
+    return {
+        "valid": True,
+        "starts_at": starts_at.isoformat(timespec="minutes"),
+        "ends_at": ends_at.isoformat(timespec="minutes"),
+        "unavailable_lots": unavailable_lots,
+        "template_availability": template_availability,
+    }
+
+
+class AvailabilityEngine:
+    """Process-wide reservation index, rebuilt when ``reservations_version`` moves."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.snapshot: AvailabilitySnapshot | None = None
+
+    def get(self, db: Session) -> AvailabilitySnapshot:
+        version = read_reservations_version(db)
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self.snapshot = build_availability_snapshot(db, version)
+        return snapshot
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import hashlib
+import json
+import secrets
+import threading
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from app.models import AppSetting, Lot, MaterialTemplate
+
+CATALOG_VERSION_KEY = "catalog_version"
+LOT_COLORS = [
+    "#2563eb",
+    "#16a34a",
+    "#dc2626",
+    "#9333ea",
+    "#0891b2",
+    "#ca8a04",
+    "#db2777",
+    "#475569",
+]
+
+
+def get_lot_color(lot: Lot | None) -> str | None:
+    if not lot:
+        return None
+    seed = lot.id or sum(ord(char) for char in lot.name)
+    return LOT_COLORS[seed % len(LOT_COLORS)]
+
+
+@dataclass(frozen=True)
+class CatalogTemplate:
+    id: int
+    name: str
+    node_type: str
+    expected_qty: int | None
+
+
+@dataclass(frozen=True)
+class CatalogLot:
+    id: int
+    name: str
+    color: str | None
+    templates: tuple[CatalogTemplate, ...]
+
+    @property
+    def template_ids(self) -> list[int]:
+        return [template.id for template in self.templates]
+
+
+@dataclass
+class CatalogSnapshot:
+    """Root templates and lots as the event forms need them, already sorted."""
+
+    version: str
+    templates: list[CatalogTemplate]
+    lots: list[CatalogLot]
+    template_index: dict[int, str] = field(default_factory=dict)
+    template_payload: dict[str, dict[str, Any]] = field(default_factory=dict)
+    lot_payload: list[dict[str, Any]] = field(default_factory=list)
+    template_groups: list[dict[str, Any]] = field(default_factory=list)
+    template_choices: list[dict[str, Any]] = field(default_factory=list)
+    lot_choices: list[dict[str, Any]] = field(default_factory=list)
+    # Serialized /api/catalog body and its ETag, built on first request.
+    payload: bytes | None = None
+    etag: str | None = None
+
+
+def build_catalog_payload(db: Session, snapshot: CatalogSnapshot) -> bytes:
+    materials = db.execute(
+        select(
+            MaterialTemplate.id,
+            MaterialTemplate.name,
+            MaterialTemplate.node_type,
+            MaterialTemplate.expected_qty,
+            MaterialTemplate.parent_id,
+        ).order_by(MaterialTemplate.id)
+    ).all()
+    content = {
+        "version": snapshot.version,
+        "materials": [
+            {
+                "id": row.id,
+                "name": row.name,
+                "node_type": row.node_type,
+                "expected_qty": row.expected_qty,
+                "parent_id": row.parent_id,
+            }
+            for row in materials
+        ],
+        "template_index": snapshot.template_index,
+        "templates": snapshot.template_payload,
+        "lots": snapshot.lot_payload,
+    }
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def read_catalog_version(db: Session) -> str:
+    setting = db.get(AppSetting, CATALOG_VERSION_KEY)
+    return setting.value if setting else ""
+
+
+def bump_catalog_version(db: Session) -> None:
+    """Mark the catalog as changed; commits with the caller's transaction."""
+    db.merge(AppSetting(key=CATALOG_VERSION_KEY, value=secrets.token_hex(8)))
+
+
+def build_catalog_snapshot(db: Session, version: str) -> CatalogSnapshot:
+    roots = db.scalars(
+        select(MaterialTemplate).where(MaterialTemplate.parent_id.is_(None))
+    ).all()
+    templates = sorted(
+        (
+            CatalogTemplate(
+                id=template.id,
+                name=template.name,
+                node_type=template.node_type,
+                expected_qty=template.expected_qty,
+            )
+            for template in roots
+        ),
+        key=lambda item: item.name.lower(),
+    )
+    templates_by_id = {template.id: template for template in templates}
+    lot_rows = db.scalars(select(Lot).options(selectinload(Lot.materials))).all()
+    lots = sorted(
+        (
+            CatalogLot(
+                id=lot.id,
+                name=lot.name,
+                color=get_lot_color(lot),
+                templates=tuple(
+                    sorted(
+                        (
+                            templates_by_id[material.id]
+                            for material in lot.materials
+                            if material.id in templates_by_id
+                        ),
+                        key=lambda item: item.name.lower(),
+                    )
+                ),
+            )
+            for lot in lot_rows
+        ),
+        key=lambda item: item.name.lower(),
+    )
+    snapshot = CatalogSnapshot(version=version, templates=templates, lots=lots)
+    snapshot.template_index = {template.id: template.name for template in templates}
+    snapshot.template_payload = {
+        str(template.id): {
+            "name": template.name,
+            "type": template.node_type,
+            "max_qty": template.expected_qty,
+        }
+        for template in templates
+    }
+    snapshot.lot_payload = [
+        {
+            "id": lot.id,
+            "name": lot.name,
+            "color": lot.color,
+            "template_ids": lot.template_ids,
+        }
+        for lot in lots
+    ]
+    assigned_template_ids: set[int] = set()
+    for lot in lots:
+        group_templates = [
+            template for template in lot.templates if template.id not in assigned_template_ids
+        ]
+        if group_templates:
+            snapshot.template_groups.append({"label": lot.name, "templates": group_templates})
+            assigned_template_ids.update(template.id for template in group_templates)
+    ungrouped_templates = [
+        template for template in templates if template.id not in assigned_template_ids
+    ]
+    if ungrouped_templates:
+        snapshot.template_groups.append({"label": "Hors lot", "templates": ungrouped_templates})
+    snapshot.template_choices = [
+        {"id": template.id, "label": template.name, "node_type": template.node_type}
+        for template in templates
+    ]
+    snapshot.lot_choices = [
+        {
+            "id": lot.id,
+            "label": lot.name,
+            "color": lot.color,
+            "count": len(lot.templates),
+        }
+        for lot in lots
+    ]
+    return snapshot
+
+
+class CatalogCache:
+    """Process-wide catalog snapshot, rebuilt when ``catalog_version`` moves.
+
+    Writers call ``bump_catalog_version`` in their transaction, so every
+    worker notices the change with a single primary-key read.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.snapshot: CatalogSnapshot | None = None
+
+    def get(self, db: Session) -> CatalogSnapshot:
+        version = read_catalog_version(db)
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            snapshot = self.snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self.snapshot = build_catalog_snapshot(db, version)
+        return snapshot
+
+    def payload(self, db: Session) -> tuple[bytes, str]:
+        """The JSON catalog body with a strong ETag derived from its bytes."""
+        snapshot = self.get(db)
+        if snapshot.payload is None:
+            with self.lock:
+                if snapshot.payload is None:
+                    body = build_catalog_payload(db, snapshot)
+                    snapshot.etag = f'"catalog-{hashlib.sha256(body).hexdigest()[:20]}"'
+                    snapshot.payload = body
+        return snapshot.payload, snapshot.etag
+
+    def invalidate(self) -> None:
+        self.snapshot = None
@@ -0,0 +1,383 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from sqlalchemy import and_, case, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.hierarchy import path_ids
+from app.models import Event, EventNode
+
+STATUS_KEYS = ("ok", "problem", "pending")
+
+
+def normalize_status(value: str | None) -> str:
+    if value == "ok":
+        return "ok"
+    if value == "problem":
+        return "problem"
+    return "pending"
+
+
+def empty_counts() -> dict[str, int]:
+    return {"total": 0, "ok": 0, "problem": 0, "pending": 0}
+
+
+def derive_container_status(child_statuses: dict[str, int], child_total: int) -> str:
+    if child_statuses["ok"] == child_total:
+        return "ok"
+    if child_statuses["problem"]:
+        return "problem"
+    return "pending"
+
+
+def progress_from_counts(total: int, ok: int, problem: int) -> dict[str, Any]:
+    return {
+        "total": total,
+        "ok": ok,
+        "problem": problem,
+        "pending": total - ok - problem,
+        "percent": int((ok / total) * 100) if total else 0,
+    }
+
+
+@dataclass
+class ChecklistNode:
+    id: int
+    parent_id: int | None
+    node_type: str
+    status: str
+    children: list[int] = field(default_factory=list)
+    rollup_status: str = "pending"
+    counts: dict[str, int] = field(default_factory=empty_counts)
+    child_statuses: dict[str, int] = field(
+        default_factory=lambda: {key: 0 for key in STATUS_KEYS}
+    )
+
+    @property
+    def is_checkable(self) -> bool:
+        return self.node_type == "item" or (
+            self.node_type == "container" and not self.children
+        )
+
+
+class EventChecklist:
+    """Aggregated checklist state of one event, built from its node rows."""
+
+    def __init__(self, rows: Iterable[Any]) -> None:
+        self.nodes: dict[int, ChecklistNode] = {}
+        for row in rows:
+            self.nodes[row.id] = ChecklistNode(
+                id=row.id,
+                parent_id=row.parent_id,
+                node_type=row.node_type,
+                status=normalize_status(row.status),
+            )
+        for node in self.nodes.values():
+            parent = self.nodes.get(node.parent_id) if node.parent_id else None
+            if parent:
+                parent.children.append(node.id)
+        self.totals = {key: 0 for key in STATUS_KEYS}
+        for node in self.nodes.values():
+            if node.is_checkable:
+                self.totals[node.status] += 1
+        for node in self.nodes.values():
+            if node.parent_id not in self.nodes:
+                self._build_rollup(node)
+
+    def _build_rollup(self, node: ChecklistNode) -> None:
+        if node.node_type == "item" or not node.children:
+            node.rollup_status = node.status
+            node.counts = empty_counts()
+            if node.node_type == "item":
+                node.counts["total"] = 1
+                node.counts[node.status] = 1
+            return
+        node.counts = empty_counts()
+        for child_id in node.children:
+            child = self.nodes[child_id]
+            self._build_rollup(child)
+            node.child_statuses[child.rollup_status] += 1
+            for key in node.counts:
+                node.counts[key] += child.counts[key]
+        node.rollup_status = derive_container_status(
+            node.child_statuses, len(node.children)
+        )
+
+    def progress(self) -> dict[str, Any]:
+        return progress_from_counts(
+            sum(self.totals.values()), self.totals["ok"], self.totals["problem"]
+        )
+
+    def rollup(self, node_id: int) -> tuple[str, dict[str, int]] | None:
+        node = self.nodes.get(node_id)
+        if not node:
+            return None
+        return node.rollup_status, dict(node.counts)
+
+
+def checkable_node_clause() -> Any:
+    """SQL equivalent of ChecklistNode.is_checkable: items and leaf containers."""
+    child = aliased(EventNode)
+    has_children = select(child.id).where(child.parent_id == EventNode.id).exists()
+    return or_(
+        EventNode.node_type == "item",
+        and_(EventNode.node_type == "container", ~has_children),
+    )
+
+
+def event_progress_summaries(
+    db: Session, event_ids: Iterable[int]
+) -> dict[int, dict[str, Any]]:
+    """Progress and last update of several events from one grouped query."""
+    event_ids = list(event_ids)
+    summaries = {
+        event_id: {"progress": progress_from_counts(0, 0, 0), "last_update": None}
+        for event_id in event_ids
+    }
+    if not event_ids:
+        return summaries
+    checkable = checkable_node_clause()
+    rows = db.execute(
+        select(
+            EventNode.event_id,
+            func.sum(case((checkable, 1), else_=0)),
+            func.sum(case((and_(checkable, EventNode.status == "ok"), 1), else_=0)),
+            func.sum(case((and_(checkable, EventNode.status == "problem"), 1), else_=0)),
+            func.max(EventNode.updated_at),
+        )
+        .where(EventNode.event_id.in_(event_ids))
+        .group_by(EventNode.event_id)
+    ).all()
+    for event_id, total, ok, problem, last_update in rows:
+        summaries[event_id] = {
+            "progress": progress_from_counts(total or 0, ok or 0, problem or 0),
+            "last_update": last_update,
+        }
+    return summaries
+
+
+def locked_event_progress(db: Session, event_id: int) -> dict[str, Any]:
+    """Event progress read from the counters stored on the event row.
+
+    Call it after ``bump_event_revision``: that UPDATE locks the event row,
+    so writers of the same event take turns and each one reads the counters
+    the previous one committed.
+    """
+    db.flush()
+    counters = _event_counters(db, event_id)
+    if counters is None:
+        return progress_from_counts(0, 0, 0)
+    if counters.checklist_total is None:
+        refresh_event_rollups(db, event_id)
+        counters = _event_counters(db, event_id)
+    return progress_from_counts(
+        counters.checklist_total, counters.checklist_ok, counters.checklist_problem
+    )
+
+
+def _event_counters(db: Session, event_id: int) -> Any:
+    return db.execute(
+        select(Event.checklist_total, Event.checklist_ok, Event.checklist_problem)
+        .where(Event.id == event_id)
+    ).one_or_none()
+
+
+def rollup_values(status: str, counts: dict[str, int]) -> dict[str, Any]:
+    return {
+        "rollup_status": status,
+        "rollup_total": counts["total"],
+        "rollup_ok": counts["ok"],
+        "rollup_problem": counts["problem"],
+        "rollup_pending": counts["pending"],
+    }
+
+
+def rollup_counts(node: EventNode) -> dict[str, int]:
+    return {
+        "total": node.rollup_total or 0,
+        "ok": node.rollup_ok or 0,
+        "problem": node.rollup_problem or 0,
+        "pending": node.rollup_pending or 0,
+    }
+
+
+def refresh_event_rollups(db: Session, event_id: int) -> None:
+    """Recompute the stored rollups and the checklist counters of an event."""
+    db.flush()
+    rows = db.execute(
+        select(
+            EventNode.id,
+            EventNode.parent_id,
+            EventNode.node_type,
+            EventNode.status,
+            EventNode.rollup_status,
+            EventNode.rollup_total,
+            EventNode.rollup_ok,
+            EventNode.rollup_problem,
+            EventNode.rollup_pending,
+        ).where(EventNode.event_id == event_id)
+    ).all()
+    checklist = EventChecklist(rows)
+    updates = []
+    for row in rows:
+        values = rollup_values(*checklist.rollup(row.id))
+        if any(getattr(row, key) != value for key, value in values.items()):
+            updates.append({"id": row.id, **values})
+    if updates:
+        db.execute(update(EventNode), updates)
+    progress = checklist.progress()
+    db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(
+            checklist_total=progress["total"],
+            checklist_ok=progress["ok"],
+            checklist_problem=progress["problem"],
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def propagate_rollups(db: Session, node_ids: Iterable[int]) -> None:
+    """Refresh the rollups of changed nodes and of their ancestor chain.
+
+    Runs inside the caller's transaction: changed leaves are rewritten from
+    their own status, then each ancestor level is re-aggregated from its
+    direct children, deepest level first. The event checklist counters move
+    by the difference between the old and new leaf statuses, so callers must
+    hold the event row lock (``bump_event_revision``).
+    """
+    node_ids = list(set(node_ids))
+    if not node_ids:
+        return
+    db.flush()
+    changed = db.execute(
+        select(
+            EventNode.id,
+            EventNode.event_id,
+            EventNode.parent_id,
+            EventNode.node_type,
+            EventNode.status,
+            EventNode.path,
+            EventNode.rollup_status,
+        ).where(EventNode.id.in_(node_ids))
+    ).all()
+    container_ids = [row.id for row in changed if row.node_type == "container"]
+    non_leaf_ids = (
+        set(
+            db.scalars(
+                select(EventNode.parent_id)
+                .where(EventNode.parent_id.in_(container_ids))
+                .distinct()
+            ).all()
+        )
+        if container_ids
+        else set()
+    )
+    leaf_updates = []
+    deltas: dict[int, dict[str, int]] = defaultdict(empty_counts)
+    for row in changed:
+        if row.id in non_leaf_ids:
+            continue
+        status = normalize_status(row.status)
+        counts = empty_counts()
+        if row.node_type == "item":
+            counts["total"] = 1
+            counts[status] = 1
+        leaf_updates.append({"id": row.id, **rollup_values(status, counts)})
+        # Every leaf is checkable; its stored rollup status was last counted.
+        previous = normalize_status(row.rollup_status)
+        if previous != status:
+            deltas[row.event_id][previous] -= 1
+            deltas[row.event_id][status] += 1
+    if leaf_updates:
+        db.execute(update(EventNode), leaf_updates)
+    for event_id, delta in deltas.items():
+        if delta["ok"] or delta["problem"]:
+            db.execute(
+                update(Event)
+                .where(Event.id == event_id)
+                .values(
+                    checklist_ok=Event.checklist_ok + delta["ok"],
+                    checklist_problem=Event.checklist_problem + delta["problem"],
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+    # Ancestors are read off the materialized path; each one is re-aggregated
+    # after all of its changed descendants, whatever their depth.
+    levels: dict[int, int] = {}
+    for row in changed:
+        if row.parent_id is None or row.id in non_leaf_ids:
+            continue
+        ancestors = path_ids(row.path)[:-1] if row.path else []
+        if not ancestors or ancestors[-1] != row.parent_id:
+            ancestors = _ancestor_chain(db, row.parent_id)
+        for level, ancestor_id in enumerate(reversed(ancestors), start=1):
+            levels[ancestor_id] = max(levels.get(ancestor_id, 0), level)
+    depth = max(levels.values(), default=0)
+    if levels:
+        # Concurrent ticks under the same container must aggregate one after
+        # the other, or the later commit writes back a stale parent rollup.
+        db.execute(
+            select(EventNode.id)
+            .where(EventNode.id.in_(list(levels)))
+            .order_by(EventNode.id)
+            .with_for_update()
+        ).all()
+
+    for level in range(1, depth + 1):
+        level_ids = [node_id for node_id, value in levels.items() if value == level]
+        aggregates = db.execute(
+            select(
+                EventNode.parent_id,
+                func.count(EventNode.id),
+                func.coalesce(func.sum(EventNode.rollup_total), 0),
+                func.coalesce(func.sum(EventNode.rollup_ok), 0),
+                func.coalesce(func.sum(EventNode.rollup_problem), 0),
+                func.coalesce(func.sum(EventNode.rollup_pending), 0),
+                func.sum(case((EventNode.rollup_status == "ok", 1), else_=0)),
+                func.sum(case((EventNode.rollup_status == "problem", 1), else_=0)),
+            )
+            .where(EventNode.parent_id.in_(level_ids))
+            .group_by(EventNode.parent_id)
+        ).all()
+        level_updates = []
+        for parent_id, child_total, total, ok, problem, pending, ok_children, problem_children in aggregates:
+            status = derive_container_status(
+                {"ok": ok_children, "problem": problem_children, "pending": 0},
+                child_total,
+            )
+            counts = {"total": total, "ok": ok, "problem": problem, "pending": pending}
+            level_updates.append({"id": parent_id, **rollup_values(status, counts)})
+        if level_updates:
+            db.execute(update(EventNode), level_updates)
+
+
+def _ancestor_chain(db: Session, parent_id: int) -> list[int]:
+    """Ancestors from the root down to ``parent_id``, for rows without a path."""
+    chain = []
+    while parent_id is not None:
+        chain.append(parent_id)
+        parent_id = db.scalar(select(EventNode.parent_id).where(EventNode.id == parent_id))
+    return list(reversed(chain))
+
+
+def backfill_event_rollups(db: Session) -> None:
+    event_ids = db.scalars(
+        select(Event.id).where(
+            or_(
+                Event.checklist_total.is_(None),
+                Event.id.in_(
+                    select(EventNode.event_id).where(EventNode.rollup_status.is_(None))
+                ),
+            )
+        )
+    ).all()
+    for event_id in event_ids:
+        refresh_event_rollups(db, event_id)
+    if event_ids:
+        db.commit()
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Iterable
+
+from sqlalchemy import String, cast, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import EventNode, MaterialTemplate, lot_materials
+
+# ``path`` holds the ids from the root down to the node itself, e.g. "/3/17/42/",
+# so a subtree is a prefix match and the ancestors can be read off the string.
+PATH_SEPARATOR = "/"
+
+
+def node_path(parent_path: str | None, node_id: int) -> str:
+    return f"{parent_path or PATH_SEPARATOR}{node_id}{PATH_SEPARATOR}"
+
+
+def path_ids(path: str | None) -> list[int]:
+    """Ids along a path, root first and the node itself last."""
+    return [int(part) for part in (path or "").split(PATH_SEPARATOR) if part]
+
+
+def assign_path(db: Session, node: Any, parent_path: str | None = None) -> str:
+    """Set the path of a freshly added node, flushing it first to get an id.
+
+    Pass ``parent_path`` when the caller already knows it, otherwise it is
+    read from the parent row.
+    """
+    if node.id is None:
+        db.flush()
+    if node.parent_id is not None and parent_path is None:
+        model = type(node)
+        parent_path = db.scalar(select(model.path).where(model.id == node.parent_id))
+    node.path = node_path(parent_path if node.parent_id is not None else None, node.id)
+    return node.path
+
+
+def subtree_clause(model: Any, paths: Iterable[str]) -> Any:
+    """WHERE clause matching every node under (and including) the given paths."""
+    return or_(*[model.path.like(f"{path}%") for path in paths])
+
+
+def subtree_paths(db: Session, model: Any, root_ids: Iterable[int]) -> list[str]:
+    root_ids = list(root_ids)
+    if not root_ids:
+        return []
+    return [
+        path
+        for path in db.scalars(select(model.path).where(model.id.in_(root_ids))).all()
+        if path
+    ]
+
+
+def subtree_ids(
+    db: Session, model: Any, root_ids: Iterable[int], include_roots: bool = True
+) -> list[int]:
+    """Ids of every descendant of ``root_ids`` (and the roots), in one query."""
+    root_ids = list(root_ids)
+    paths = subtree_paths(db, model, root_ids)
+    if not paths:
+        return []
+    ids = set(db.scalars(select(model.id).where(subtree_clause(model, paths))).all())
+    if not include_roots:
+        ids.difference_update(root_ids)
+    return list(ids)
+
+
+def subtree_nodes(db: Session, model: Any, root: Any, *criteria: Any) -> list[Any]:
+    """The loaded root followed by its descendants, in one indexed query."""
+    if not root.path:
+        raise ValueError(f"Node {root.id} has no path; run backfill_paths first.")
+    return db.scalars(
+        select(model).where(subtree_clause(model, [root.path]), *criteria)
+    ).all()
+
+
+def ancestor_ids(node: Any) -> list[int]:
+    """Ids of the ancestors of a node, root first, without querying."""
+    return path_ids(node.path)[:-1]
+
+
+def ancestors(db: Session, model: Any, node: Any) -> list[Any]:
+    ids = ancestor_ids(node)
+    if not ids:
+        return []
+    by_id = {entry.id: entry for entry in db.scalars(select(model).where(model.id.in_(ids)))}
+    return [by_id[entry_id] for entry_id in ids if entry_id in by_id]
+
+
+def move_subtree(db: Session, node: Any, parent_id: int | None) -> None:
+    """Reparent a node and rewrite the paths of its whole subtree.
+
+    The node's own row is rewritten by the same UPDATE as its descendants,
+    so path queries made right after the move see the new subtree.
+    """
+    model = type(node)
+    if not node.path:
+        raise ValueError(f"Node {node.id} has no path; run backfill_paths first.")
+    parent_path = None
+    if parent_id is not None:
+        parent_path = db.scalar(select(model.path).where(model.id == parent_id))
+        if parent_path is None or node.id in path_ids(parent_path):
+            raise ValueError("Cannot move a node under itself or a missing parent.")
+    old_path = node.path
+    new_path = node_path(parent_path, node.id)
+    if old_path != new_path:
+        db.execute(
+            update(model)
+            .where(model.path.like(f"{old_path}%"))
+            .values(path=literal(new_path) + func.substr(model.path, len(old_path) + 1))
+            .execution_options(synchronize_session=False)
+        )
+    node.parent_id = parent_id
+    node.path = new_path
+    db.flush()
+
+
+def clone_subtrees(
+    db: Session,
+    model: Any,
+    root_ids: Iterable[int],
+    columns: Iterable[str],
+    values: dict[str, Any] | None = None,
+    root_values: dict[int, dict[str, Any]] | None = None,
+) -> list[int]:
+    """Copy whole subtrees with one query to read them and one INSERT per level.
+
+    ``columns`` are copied from the source rows, ``values`` apply to every
+    copy and ``root_values`` (keyed by source root id) to the copied roots.
+    Returns the ids of the new roots in the order of ``root_ids``.
+    """
+    root_ids = list(root_ids)
+    paths = subtree_paths(db, model, root_ids)
+    if not paths:
+        return []
+    columns = list(columns)
+    rows = db.execute(
+        select(model.id, model.parent_id, *[getattr(model, name) for name in columns])
+        .where(subtree_clause(model, paths))
+        .order_by(model.id)
+    ).all()
+    children_by_parent: dict[int, list[Any]] = defaultdict(list)
+    rows_by_id = {}
+    for row in rows:
+        rows_by_id[row.id] = row
+        if row.parent_id is not None:
+            children_by_parent[row.parent_id].append(row)
+    values = values or {}
+    root_values = root_values or {}
+
+    def copy_values(row: Any, parent_id: int | None) -> dict[str, Any]:
+        copied = {name: getattr(row, name) for name in columns}
+        copied.update(values)
+        copied["parent_id"] = parent_id
+        return copied
+
+    level = [
+        (
+            rows_by_id[root_id],
+            None,
+            {**copy_values(rows_by_id[root_id], None), **root_values.get(root_id, {})},
+        )
+        for root_id in root_ids
+        if root_id in rows_by_id
+    ]
+    new_root_ids: list[int] = []
+    while level:
+        new_ids = db.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [copied for _row, _parent_path, copied in level],
+        ).all()
+        new_paths = [
+            node_path(parent_path, new_id)
+            for (_row, parent_path, _copied), new_id in zip(level, new_ids)
+        ]
+        db.execute(
+            update(model),
+            [{"id": new_id, "path": path} for new_id, path in zip(new_ids, new_paths)],
+        )
+        if not new_root_ids:
+            new_root_ids = list(new_ids)
+        level = [
+            (child, path, copy_values(child, new_id))
+            for (row, _parent_path, _copied), new_id, path in zip(level, new_ids, new_paths)
+            for child in children_by_parent.get(row.id, [])
+        ]
+    return new_root_ids
+
+
+def backfill_paths(db: Session) -> None:
+    """Fill missing paths level by level, for rows created before the column."""
+    for model in (MaterialTemplate, EventNode):
+        db.execute(
+            update(model)
+            .where(model.path.is_(None), model.parent_id.is_(None))
+            .values(
+                path=literal(PATH_SEPARATOR)
+                + cast(model.id, String)
+                + literal(PATH_SEPARATOR)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        parent = model.__table__.alias("parent")
+        parent_path = (
+            select(parent.c.path)
+            .where(parent.c.id == model.parent_id)
+            .scalar_subquery()
+        )
+        has_parent_path = (
+            select(parent.c.id)
+            .where(parent.c.id == model.parent_id, parent.c.path.is_not(None))
+            .exists()
+        )
+        while True:
+            result = db.execute(
+                update(model)
+                .where(model.path.is_(None), has_parent_path)
+                .values(
+                    path=parent_path + cast(model.id, String) + literal(PATH_SEPARATOR)
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if not result.rowcount:
+                break
+    db.commit()
+
+
+def delete_template_subtrees(
+    db: Session, root_ids: Iterable[int], include_roots: bool = True
+) -> int:
+    ids = subtree_ids(db, MaterialTemplate, root_ids, include_roots)
+    if not ids:
+        return 0
+    db.execute(delete(lot_materials).where(lot_materials.c.material_template_id.in_(ids)))
+    db.execute(
+        delete(MaterialTemplate)
+        .where(MaterialTemplate.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    return len(ids)
+
+
+def delete_event_node_subtrees(
+    db: Session, root_ids: Iterable[int], include_roots: bool = True
+) -> int:
+    ids = subtree_ids(db, EventNode, root_ids, include_roots)
+    if not ids:
+        return 0
+    db.execute(
+        delete(EventNode)
+        .where(EventNode.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    return len(ids)
@@ -4,34 +4,80 @@ from collections import defaultdict
 from datetime import date, datetime, time as datetime_time, timedelta
 from email.utils import parsedate_to_datetime
 from html import unescape
+import io
 import json
 import os
 import re
 import secrets
 import threading
 import time
-from typing import Any
+from typing import Any, Iterator
 from urllib.error import URLError
 from urllib.request import Request as UrlRequest, urlopen
 from xml.etree import ElementTree
 
 from fastapi import (
+    Body,
     Depends,
     FastAPI,
+    File,
     Form,
     HTTPException,
+    Query,
     Request,
+    UploadFile,
     WebSocket,
     WebSocketDisconnect,
 )
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload
-
-from app.auth import AuthError, create_access_token, hash_password, verify_password
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session, make_transient_to_detached, selectinload
+
+from app.auth import (
+    AuthError,
+    PasswordQueueFull,
+    PrincipalCache,
+    create_access_token,
+    hash_password,
+    password_hasher,
+)
+from app.availability import (
+    AvailabilityEngine,
+    bump_reservations_version,
+    template_capacity,
+    window_availability,
+)
+from app.catalog import CatalogCache, bump_catalog_version, get_lot_color
+from app.checklist import (
+    backfill_event_rollups,
+    event_progress_summaries,
+    locked_event_progress,
+    propagate_rollups,
+    refresh_event_rollups,
+    rollup_counts,
+)
 from app.db import SessionLocal, init_db
+from app.hierarchy import (
+    assign_path,
+    backfill_paths,
+    delete_event_node_subtrees,
+    clone_subtrees,
+    delete_template_subtrees,
+    move_subtree,
+    node_path,
+    subtree_clause,
+    subtree_nodes,
+    subtree_paths,
+)
 from app.ldap_auth import (
     LDAP_BIND_PASSWORD_SETTING_KEY,
     LdapAuthError,
@@ -49,6 +95,14 @@ from app.models import (
     TemplateReservation,
     User,
 )
+from app.offline_sync import SyncFormatError, parse_sync_changes
+from app.realtime import ConnectionManager, create_broadcast_backend
+from app.template_import import (
+    ImportFormatError,
+    ParentReport,
+    insert_import_trees,
+    read_import_document,
+)
 
 app = FastAPI()
 
@@ -61,6 +115,18 @@ ROLE_CHIEF = "chief"
 ROLE_STOCK = "stock"
 AUTH_SOURCE_LOCAL = "local"
 AUTH_SOURCE_LDAP = "ldap"
+EVENTS_PAGE_SIZE = 20
+EXPORT_BATCH_SIZE = 50
+TEMPLATE_CLONE_COLUMNS = ("name", "node_type", "expected_qty")
+EVENT_NODE_CLONE_COLUMNS = (
+    "name",
+    "node_type",
+    "expected_qty",
+    "source_lot_id",
+    "source_lot_name",
+    "source_lot_color",
+    "sort_order",
+)
 VIGICRUES_RSS_URL = "https://www.vigicrues.gouv.fr/territoire/rss?CdEntVigiCru={code}"
 VIGICRUES_LEVEL_ORDER = {"vert": 0, "jaune": 1, "orange": 2, "rouge": 3}
 VIGICRUES_DEFAULT_SEGMENTS = (
@@ -342,21 +408,12 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
 
-class ConnectionManager:
-    def __init__(self) -> None:
-        self.active: dict[int, list[WebSocket]] = defaultdict(list)
-
-    async def connect(self, event_id: int, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.active[event_id].append(websocket)
-
-    def disconnect(self, event_id: int, websocket: WebSocket) -> None:
-        if websocket in self.active.get(event_id, []):
-            self.active[event_id].remove(websocket)
-
-    async def broadcast(self, event_id: int, payload: dict[str, Any]) -> None:
-        for connection in list(self.active.get(event_id, [])):
-            await connection.send_json(payload)
+@app.exception_handler(PasswordQueueFull)
+async def password_queue_full_handler(request: Request, exc: PasswordQueueFull):
+    # Password changes outside /login hit the same bounded hashing pool.
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"}
+    )
 
 
 def build_event_detail_payload(event_id: int, db: Session) -> dict[str, Any]:
@@ -401,7 +458,10 @@ def build_event_detail_payload(event_id: int, db: Session) -> dict[str, Any]:
     }
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(backend=create_broadcast_backend())
+catalog_cache = CatalogCache()
+principal_cache = PrincipalCache()
+availability_engine = AvailabilityEngine()
 
 
 @app.on_event("startup")
@@ -419,10 +479,71 @@ def startup() -> None:
             )
             db.add(admin_user)
             db.commit()
+        backfill_paths(db)
+        backfill_event_rollups(db)
     finally:
         db.close()
 
 
+@app.on_event("startup")
+async def start_realtime() -> None:
+    await manager.start()
+
+
+@app.on_event("shutdown")
+def stop_realtime() -> None:
+    manager.stop()
+
+
+def bump_event_revision(db: Session, event_id: int) -> int:
+    """Increment the event change counter inside the current transaction."""
+    revision = db.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(revision=Event.revision + 1)
+        .returning(Event.revision)
+    ).scalar()
+    return revision or 0
+
+
+def mark_verification_progress(event: Event, progress: dict[str, Any], now: datetime) -> None:
+    """Set the verification start and completion flags from a progress dict."""
+    if not event.verification_started_at:
+        event.verification_started_at = now
+    if progress["total"] and progress["pending"] == 0:
+        event.verification_completed_at = now
+    else:
+        event.verification_completed_at = None
+
+
+def event_live_etag(event_id: int, revision: int) -> str:
+    return f'W/"event-{event_id}-{revision}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak ``If-None-Match`` comparison against one of our ETags."""
+    header = request.headers.get("if-none-match", "")
+    expected = etag.strip().removeprefix("W/")
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == expected:
+            return True
+    return False
+
+
+def notify_event_structure(event_id: int, seq: int | None = None) -> None:
+    try:
+        import anyio
+
+        anyio.from_thread.run(
+            manager.broadcast,
+            event_id,
+            {"type": "structure", "event_id": event_id, "seq": seq},
+        )
+    except RuntimeError:
+        pass
+
+
 def get_db() -> Session:
     db = SessionLocal()
     try:
@@ -441,10 +562,24 @@ def save_app_setting(db: Session, key: str, value: str) -> None:
     db.commit()
 
 
+def principal_columns(user: User) -> dict[str, Any]:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def principal_user(principal: dict[str, Any]) -> User:
+    """A detached User per request, so routes can still ``db.add`` it."""
+    user = User(**principal)
+    make_transient_to_detached(user)
+    return user
+
+
 def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(status_code=401, detail="Non authentifié")
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal_user(principal)
     try:
         data = create_token_data(token)
     except AuthError as exc:
@@ -452,6 +587,7 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
     user = db.scalar(select(User).where(User.username == data["sub"]))
     if not user:
         raise HTTPException(status_code=401, detail="Utilisateur inconnu")
+    principal_cache.put(token, user.username, principal_columns(user), data.get("exp"))
     return user
 
 
@@ -496,16 +632,42 @@ def provision_ldap_user(db: Session, ldap_user) -> User:
     db.add(user)
     db.commit()
     db.refresh(user)
+    principal_cache.evict_user(user.username)
     return user
 
 
-def verify_local_user_password(user: User, password: str) -> bool:
+async def verify_local_user_password(db: Session, user: User, password: str) -> bool:
+    """Check a local password on the hashing pool, upgrading outdated hashes."""
     if not user.password_hash or user.password_hash == "LDAP_MANAGED":
         return False
     try:
-        return verify_password(password, user.password_hash)
+        verified, new_hash = await password_hasher.verify_and_update_async(
+            password, user.password_hash
+        )
+    except PasswordQueueFull:
+        raise
     except Exception:
         return False
+    if verified and new_hash:
+        await run_in_threadpool(store_rehashed_password, db, user, new_hash)
+    return verified
+
+
+def store_rehashed_password(db: Session, user: User, new_hash: str) -> None:
+    # Refreshed here so login can read the user back on the event loop
+    # without a lazy reload of the expired row.
+    user.password_hash = new_hash
+    db.commit()
+    db.refresh(user)
+    principal_cache.evict_user(user.username)
+
+
+def login_ldap_user(db: Session, username: str, password: str) -> User | None:
+    try:
+        ldap_user = authenticate_ldap(username, password)
+        return provision_ldap_user(db, ldap_user)
+    except LdapAuthError:
+        return None
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -516,33 +678,59 @@ def home(
 ):
     if user.must_change_password:
         return RedirectResponse("/password", status_code=303)
-    events = db.scalars(select(Event)).all()
-    materials = db.scalars(select(MaterialTemplate)).all()
-    nodes = db.scalars(select(EventNode)).all()
-
-    nodes_by_event: dict[int, list[EventNode]] = defaultdict(list)
-    for node in nodes:
-        nodes_by_event[node.event_id].append(node)
-
-    issues = [node for node in nodes if node.status == "problem"]
-    pending_items = [
-        node
-        for node in nodes
-        if node.node_type == "item" and node.status not in ("ok", "problem")
-    ]
-    parents = [item for item in materials if item.parent_id is None]
+    events_total, events_open = db.execute(
+        select(
+            func.count(Event.id),
+            func.coalesce(func.sum(case((Event.status == "open", 1), else_=0)), 0),
+        )
+    ).one()
+    materials_total, parents_total = db.execute(
+        select(
+            func.count(MaterialTemplate.id),
+            func.coalesce(
+                func.sum(case((MaterialTemplate.parent_id.is_(None), 1), else_=0)), 0
+            ),
+        )
+    ).one()
+    issues_total, pending_items_total = db.execute(
+        select(
+            func.coalesce(func.sum(case((EventNode.status == "problem", 1), else_=0)), 0),
+            func.coalesce(
+                func.sum(
+                    case(
+                        (
+                            and_(
+                                EventNode.node_type == "item",
+                                or_(
+                                    EventNode.status.is_(None),
+                                    EventNode.status.not_in(("ok", "problem")),
+                                ),
+                            ),
+                            1,
+                        ),
+                        else_=0,
+                    )
+                ),
+                0,
+            ),
+        )
+    ).one()
 
     today = date.today()
-    upcoming = [
-        event
-        for event in events
-        if event.date and event.date >= today and event.status != "closed"
-    ]
-    upcoming.sort(key=lambda item: item.date)
+    upcoming = db.scalars(
+        select(Event)
+        .where(
+            Event.date >= today,
+            or_(Event.status.is_(None), Event.status != "closed"),
+        )
+        .order_by(Event.date, Event.id)
+        .limit(4)
+    ).all()
+    summaries = event_progress_summaries(db, [event.id for event in upcoming])
 
     upcoming_payload = []
-    for event in upcoming[:4]:
-        progress = compute_progress(nodes_by_event.get(event.id, []))
+    for event in upcoming:
+        progress = summaries[event.id]["progress"]
         state = derive_event_state(event, progress)
         upcoming_payload.append(
             {
@@ -553,26 +741,29 @@ def home(
             }
         )
 
-    recent_issues = []
-    sorted_issues = sorted(
-        issues, key=lambda item: item.updated_at or datetime.min, reverse=True
-    )
-    for issue in sorted_issues[:4]:
-        recent_issues.append(
-            {
-                "name": issue.name,
-                "comment": issue.comment or "Aucun commentaire",
-                "event_name": issue.event.name if issue.event else "Poste inconnu",
-            }
-        )
+    recent_rows = db.execute(
+        select(EventNode.name, EventNode.comment, Event.name)
+        .outerjoin(Event, Event.id == EventNode.event_id)
+        .where(EventNode.status == "problem")
+        .order_by(EventNode.updated_at.desc().nulls_last(), EventNode.id.desc())
+        .limit(4)
+    ).all()
+    recent_issues = [
+        {
+            "name": name,
+            "comment": comment or "Aucun commentaire",
+            "event_name": event_name or "Poste inconnu",
+        }
+        for name, comment, event_name in recent_rows
+    ]
 
     stats = {
-        "events_total": len(events),
-        "events_open": len([event for event in events if event.status == "open"]),
-        "materials": len(materials),
-        "parents": len(parents),
-        "issues": len(issues),
-        "pending_items": len(pending_items),
+        "events_total": events_total,
+        "events_open": events_open,
+        "materials": materials_total,
+        "parents": parents_total,
+        "issues": issues_total,
+        "pending_items": pending_items_total,
     }
     return templates.TemplateResponse(
         "home.html",
@@ -604,42 +795,31 @@ def login_form(request: Request):
 
 
 @app.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     db: Session = Depends(get_db),
 ):
-    user = db.scalar(select(User).where(User.username == username))
-    if user:
-        if verify_local_user_password(user, password):
-            pass
-        elif is_ldap_user(user):
-            try:
-                ldap_user = authenticate_ldap(username, password)
-                user = provision_ldap_user(db, ldap_user)
-            except LdapAuthError:
-                return templates.TemplateResponse(
-                    "login.html",
-                    {"request": request, "error": "Identifiants invalides"},
-                    status_code=401,
-                )
+    # Async so the bcrypt wait happens on the hashing pool, not on a request
+    # worker; database and LDAP calls still go through the threadpool.
+    user = await run_in_threadpool(
+        db.scalar, select(User).where(User.username == username)
+    )
+    try:
+        verified = bool(user) and await verify_local_user_password(db, user, password)
+    except PasswordQueueFull as exc:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": str(exc)},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+    if not verified:
+        if user and not is_ldap_user(user):
+            user = None
         else:
-            return templates.TemplateResponse(
-                "login.html",
-                {"request": request, "error": "Identifiants invalides"},
-                status_code=401,
-            )
-    else:
-        try:
-            ldap_user = authenticate_ldap(username, password)
-            user = provision_ldap_user(db, ldap_user)
-        except LdapAuthError:
-            return templates.TemplateResponse(
-                "login.html",
-                {"request": request, "error": "Identifiants invalides"},
-                status_code=401,
-            )
+            user = await run_in_threadpool(login_ldap_user, db, username, password)
     if not user:
         return templates.TemplateResponse(
             "login.html",
@@ -690,6 +870,7 @@ def change_password(
     user.must_change_password = False
     db.add(user)
     db.commit()
+    principal_cache.evict_user(user.username)
     return RedirectResponse("/", status_code=303)
 
 
@@ -777,6 +958,7 @@ def admin_change_password(
     target.must_change_password = target.id != user.id
     db.add(target)
     db.commit()
+    principal_cache.evict_user(target.username)
     return render_users_page(
         request,
         user,
@@ -827,6 +1009,7 @@ def admin_change_user_role(
     target.role_override = role if is_ldap_user(target) else None
     db.add(target)
     db.commit()
+    principal_cache.evict_user(target.username)
     role_labels = {
         ROLE_ADMIN: "Administrateur",
         ROLE_CHIEF: "Chef de poste",
@@ -840,6 +1023,11 @@ def admin_change_user_role(
     )
 
 
+@app.get("/api/auth/metrics")
+def auth_metrics(user: User = Depends(require_roles(ROLE_ADMIN))):
+    return JSONResponse({"password_hashing": password_hasher.metrics()})
+
+
 @app.get("/admin/ldap", response_class=HTMLResponse)
 def ldap_diagnostic_form(
     request: Request,
@@ -947,6 +1135,7 @@ def admin_delete_user(
             )
     db.delete(target)
     db.commit()
+    principal_cache.evict_user(target.username)
     return render_users_page(
         request,
         user,
@@ -969,20 +1158,11 @@ def render_materials_page(
     user: User,
     db: Session,
     error: str | None = None,
+    import_report: list[ParentReport] | None = None,
 ) -> HTMLResponse:
     materials = db.scalars(select(MaterialTemplate)).all()
     materials_index = {item.id: item.name for item in materials}
     tree = build_tree(materials)
-    materials_payload = [
-        {
-            "id": item.id,
-            "name": item.name,
-            "node_type": item.node_type,
-            "expected_qty": item.expected_qty,
-            "parent_id": item.parent_id,
-        }
-        for item in materials
-    ]
     return templates.TemplateResponse(
         "materials.html",
         {
@@ -991,8 +1171,8 @@ def render_materials_page(
             "tree": tree,
             "materials": materials,
             "materials_index": materials_index,
-            "materials_payload": materials_payload,
             "error": error,
+            "import_report": import_report,
         },
     )
 
@@ -1011,6 +1191,7 @@ def render_lots_page(
     user: User,
     db: Session,
     error: str | None = None,
+    import_report: list[ParentReport] | None = None,
 ) -> HTMLResponse:
     materials = db.scalars(select(MaterialTemplate)).all()
     root_templates = [item for item in materials if item.parent_id is None]
@@ -1034,6 +1215,25 @@ def parse_local_datetime(value: str) -> datetime | None:
         return None
 
 
+def template_quantity_error(
+    db: Session,
+    quantities: dict[int, int],
+    templates_by_id: dict[int, MaterialTemplate],
+    starts_at: datetime,
+    ends_at: datetime,
+) -> str | None:
+    """Message for the first template lacking stock over the window, if any."""
+    already_reserved: dict[int, int] = defaultdict(int)
+    for reservation in find_template_reservations(db, list(quantities), starts_at, ends_at):
+        already_reserved[reservation.template_id] += reservation.quantity
+    for template_id, requested_qty in quantities.items():
+        template = templates_by_id[template_id]
+        remaining = max(0, template_capacity(template) - already_reserved[template_id])
+        if requested_qty > remaining:
+            return f"Il ne reste que {remaining} disponible(s) pour « {template.name} » sur ce créneau."
+    return None
+
+
 def find_lot_conflicts(
     db: Session,
     lot_ids: list[int],
@@ -1054,6 +1254,15 @@ def find_lot_conflicts(
     ).all()
 
 
+def template_lot_index(lots: list[Lot]) -> dict[int, list[Lot]]:
+    """Lots containing each template, keeping the order of ``lots``."""
+    index: dict[int, list[Lot]] = defaultdict(list)
+    for lot in lots:
+        for material in lot.materials:
+            index[material.id].append(lot)
+    return index
+
+
 def find_template_reservations(
     db: Session,
     template_ids: list[int],
@@ -1071,103 +1280,64 @@ def find_template_reservations(
     ).all()
 
 
+@app.get("/api/catalog")
+def catalog_api(
+    request: Request,
+    user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
+    db: Session = Depends(get_db),
+):
+    """Templates and lots for the catalog pages, revalidated through the ETag."""
+    body, etag = catalog_cache.payload(db)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def parse_availability_window(value: str) -> tuple[datetime, datetime] | None:
+    """Parse a ``start/end`` window, as in ISO 8601 time intervals."""
+    raw_start, _separator, raw_end = value.partition("/")
+    start_value = parse_local_datetime(raw_start)
+    end_value = parse_local_datetime(raw_end)
+    if not start_value or not end_value or end_value <= start_value:
+        return None
+    return start_value, end_value
+
+
 @app.get("/api/lots/availability")
 def lots_availability(
-    starts_at: str,
-    ends_at: str,
+    starts_at: str = "",
+    ends_at: str = "",
+    window: list[str] = Query([]),
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
     db: Session = Depends(get_db),
 ):
-    start_value = parse_local_datetime(starts_at)
-    end_value = parse_local_datetime(ends_at)
-    if not start_value or not end_value or end_value <= start_value:
-        return JSONResponse(
-            {"valid": False, "unavailable_lots": []},
-            status_code=400,
-        )
-    lots = db.scalars(
-        select(Lot).options(selectinload(Lot.materials)).order_by(Lot.name)
-    ).all()
-    conflicts = find_lot_conflicts(
-        db, [lot.id for lot in lots], start_value, end_value
-    )
-    conflicts_by_lot: dict[int, list[LotReservation]] = defaultdict(list)
-    for conflict in conflicts:
-        conflicts_by_lot[conflict.lot_id].append(conflict)
-    root_templates = db.scalars(
-        select(MaterialTemplate)
-        .where(MaterialTemplate.parent_id.is_(None))
-        .order_by(MaterialTemplate.name)
-    ).all()
-    template_reservations = find_template_reservations(
-        db,
-        [template.id for template in root_templates],
-        start_value,
-        end_value,
-    )
-    reserved_by_template: dict[int, int] = defaultdict(int)
-    for reservation in template_reservations:
-        reserved_by_template[reservation.template_id] += reservation.quantity
-    full_reserved_template_ids: set[int] = set()
-    for lot in lots:
-        if any(
-            reservation.reserved_items is None
-            for reservation in conflicts_by_lot.get(lot.id, [])
-        ):
-            full_reserved_template_ids.update(
-                material.id
-                for material in lot.materials
-                if material.parent_id is None
+    """Availability of lots and root templates over one or several windows.
+
+    ``starts_at``/``ends_at`` give the main window; each extra ``window``
+    (``start/end``) is answered in the same call under ``windows``.
+    """
+    catalog = catalog_cache.get(db)
+    reservations = availability_engine.get(db)
+    windows = []
+    for value in window:
+        parsed = parse_availability_window(value)
+        if parsed is None:
+            windows.append({"valid": False, "window": value})
+        else:
+            windows.append(window_availability(reservations, catalog, *parsed))
+    main_window = parse_availability_window(f"{starts_at}/{ends_at}")
+    if main_window is None:
+        if starts_at or ends_at or not windows:
+            return JSONResponse(
+                {"valid": False, "unavailable_lots": []},
+                status_code=400,
             )
-    return {
-        "valid": True,
-        "unavailable_lots": [
-            {
-                "id": lot.id,
-                "name": lot.name,
-                "template_ids": [
-                    material.id
-                    for material in lot.materials
-                    if material.parent_id is None
-                ],
-                "reservations": [
-                    {
-                        "starts_at": reservation.starts_at.isoformat(timespec="minutes"),
-                        "ends_at": reservation.ends_at.isoformat(timespec="minutes"),
-                        "reserved_items": reservation.reserved_items,
-                    }
-                    for reservation in conflicts_by_lot[lot.id]
-                ],
-            }
-            for lot in lots
-            if lot.id in conflicts_by_lot
-        ],
-        "template_availability": [
-            {
-                "id": template.id,
-                "capacity": (
-                    template.expected_qty
-                    if template.node_type == "item" and template.expected_qty
-                    else 1
-                ),
-                "reserved": reserved_by_template[template.id],
-                "remaining": max(
-                    0,
-                    0
-                    if template.id in full_reserved_template_ids
-                    else (
-                        (
-                            template.expected_qty
-                            if template.node_type == "item" and template.expected_qty
-                            else 1
-                        )
-                        - reserved_by_template[template.id]
-                    ),
-                ),
-            }
-            for template in root_templates
-        ],
-    }
+        return {"valid": True, "windows": windows}
+    payload = window_availability(reservations, catalog, *main_window)
+    if window:
+        payload["windows"] = windows
+    return payload
 
 
 @app.get("/lots/calendar", response_class=HTMLResponse)
@@ -1336,6 +1506,7 @@ def lot_reservation_create(
             ends_at=end_value,
         )
     )
+    bump_reservations_version(db)
     db.commit()
     return RedirectResponse(f"/lots/calendar?week={redirect_week}", status_code=303)
 
@@ -1356,6 +1527,7 @@ def lot_reservation_delete(
             detail="Supprimez l'événement associé pour libérer cette réservation.",
         )
     db.delete(reservation)
+    bump_reservations_version(db)
     db.commit()
     return RedirectResponse(
         f"/lots/calendar?week={week or date.today().isoformat()}",
@@ -1380,6 +1552,8 @@ def materials_create(
         parent_id=parent_id or None,
     )
     db.add(material)
+    assign_path(db, material)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/materials", status_code=303)
 
@@ -1440,14 +1614,6 @@ def materials_wizard_create(
 
     root_qty = _safe_int(bag_data.get("qty")) if root_type == "item" else None
 
-    def _delete_descendants(node_id: int) -> None:
-        children_nodes = db.scalars(
-            select(MaterialTemplate).where(MaterialTemplate.parent_id == node_id)
-        ).all()
-        for child in children_nodes:
-            _delete_descendants(child.id)
-            db.delete(child)
-
     bag = None
     if root_id:
         bag = db.get(MaterialTemplate, root_id)
@@ -1461,8 +1627,8 @@ def materials_wizard_create(
         bag.name = bag_name
         bag.node_type = root_type
         bag.expected_qty = root_qty if root_type == "item" else None
-        bag.parent_id = None
-        _delete_descendants(bag.id)
+        move_subtree(db, bag, None)
+        delete_template_subtrees(db, [bag.id], include_roots=False)
     else:
         bag = MaterialTemplate(
             name=bag_name,
@@ -1471,9 +1637,9 @@ def materials_wizard_create(
             parent_id=None,
         )
         db.add(bag)
-        db.flush()
+        assign_path(db, bag)
 
-    def _create_tree(node_data: Any, parent_id: int) -> None:
+    def _create_tree(node_data: Any, parent: MaterialTemplate) -> None:
         if not isinstance(node_data, dict):
             return
         node_name = (node_data.get("name") or "").strip()
@@ -1487,21 +1653,65 @@ def materials_wizard_create(
             name=node_name,
             node_type=node_type,
             expected_qty=expected_qty if node_type == "item" else None,
-            parent_id=parent_id,
+            parent_id=parent.id,
         )
         db.add(node)
-        db.flush()
+        assign_path(db, node, parent.path)
         if node_type != "container":
             return
         for child in node_data.get("children") or []:
-            _create_tree(child, node.id)
+            _create_tree(child, node)
 
     for child in children:
-        _create_tree(child, bag.id)
+        _create_tree(child, bag)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/materials", status_code=303)
 
 
+def export_template_trees(db: Session, root_ids: list[int]) -> list[dict[str, Any]]:
+    """Export payload of the given root templates, loaded with one subtree query."""
+    rows = load_template_forest(db, root_ids)
+    by_id = {
+        row.id: {
+            "name": row.name,
+            "type": row.node_type,
+            "qty": row.expected_qty,
+            "children": [],
+        }
+        for row in rows
+    }
+    for row in sorted(rows, key=lambda entry: entry.id):
+        if row.parent_id in by_id:
+            by_id[row.parent_id]["children"].append(by_id[row.id])
+    return [by_id[root_id] for root_id in root_ids if root_id in by_id]
+
+
+def stream_template_export() -> Iterator[str]:
+    """The whole catalog as JSON, a batch of parents at a time.
+
+    Runs on its own session since the response outlives the request one.
+    """
+    db = SessionLocal()
+    try:
+        root_ids = db.scalars(
+            select(MaterialTemplate.id)
+            .where(MaterialTemplate.parent_id.is_(None))
+            .order_by(MaterialTemplate.id)
+        ).all()
+        yield '{"parents": ['
+        separator = "\n"
+        for index in range(0, len(root_ids), EXPORT_BATCH_SIZE):
+            batch = root_ids[index : index + EXPORT_BATCH_SIZE]
+            for tree in export_template_trees(db, batch):
+                yield separator + json.dumps(tree, ensure_ascii=False)
+                separator = ",\n"
+            db.expunge_all()
+        yield "\n]}\n"
+    finally:
+        db.close()
+
+
 @app.get("/materials/parents/export")
 def materials_parents_export(
     ids: str | None = None,
@@ -1510,6 +1720,12 @@ def materials_parents_export(
 ):
     if not ids:
         raise HTTPException(status_code=400, detail="Aucun parent sélectionné")
+    if ids.strip() == "all":
+        return StreamingResponse(
+            stream_template_export(),
+            media_type="application/json",
+            headers={"Content-Disposition": "attachment; filename=parents-export.json"},
+        )
     selected_ids = []
     for raw_id in ids.split(","):
         raw_id = raw_id.strip()
@@ -1521,22 +1737,16 @@ def materials_parents_export(
             continue
     if not selected_ids:
         raise HTTPException(status_code=400, detail="Aucun parent sélectionné")
-    parents = db.scalars(
-        select(MaterialTemplate).where(
+    parent_ids = db.scalars(
+        select(MaterialTemplate.id)
+        .where(
             MaterialTemplate.id.in_(selected_ids),
             MaterialTemplate.parent_id.is_(None),
         )
+        .order_by(MaterialTemplate.id)
     ).all()
 
-    def build_tree(node: MaterialTemplate) -> dict[str, Any]:
-        return {
-            "name": node.name,
-            "type": node.node_type,
-            "qty": node.expected_qty,
-            "children": [build_tree(child) for child in node.children],
-        }
-
-    payload = {"parents": [build_tree(parent) for parent in parents]}
+    payload = {"parents": export_template_trees(db, list(parent_ids))}
     content = json.dumps(payload, ensure_ascii=False, indent=2)
     return Response(
         content=content,
@@ -1548,71 +1758,52 @@ def materials_parents_export(
 @app.post("/materials/parents/import")
 def materials_parents_import(
     request: Request,
-    items_payload: str = Form(...),
+    items_payload: str | None = Form(None),
+    items_file: UploadFile | None = File(None),
     db: Session = Depends(get_db),
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
 ):
+    if items_file is not None and items_file.filename:
+        stream = items_file.file
+    elif items_payload:
+        stream = io.BytesIO(items_payload.encode("utf-8"))
+    else:
+        return render_materials_page(
+            request,
+            user,
+            db,
+            error="Aucun parent sélectionné pour l'import.",
+        )
     try:
-        payload = json.loads(items_payload)
-    except json.JSONDecodeError:
+        reports = read_import_document(stream)
+    except ImportFormatError as exc:
         return render_materials_page(
             request,
             user,
             db,
-            error="Le fichier importé est invalide.",
+            error=f"Le fichier importé est invalide : {exc}",
         )
-    raw_parents = payload.get("parents") if isinstance(payload, dict) else None
-    if not isinstance(raw_parents, list) or not raw_parents:
+    if not reports:
         return render_materials_page(
             request,
             user,
             db,
             error="Aucun parent sélectionné pour l'import.",
         )
-
-    def _safe_int(value: Any) -> int | None:
-        try:
-            return int(value)
-        except (TypeError, ValueError):
-            return None
-
-    def _create_tree(node_data: Any, parent_id: int | None) -> bool:
-        if not isinstance(node_data, dict):
-            return False
-        name = (node_data.get("name") or "").strip()
-        if not name:
-            return False
-        node_type = node_data.get("type") or node_data.get("node_type") or "container"
-        if node_type not in {"container", "item"}:
-            node_type = "container"
-        qty = _safe_int(node_data.get("qty")) if node_type == "item" else None
-        node = MaterialTemplate(
-            name=name,
-            node_type=node_type,
-            expected_qty=qty,
-            parent_id=parent_id,
-        )
-        db.add(node)
-        db.flush()
-        children = node_data.get("children") if node_type == "container" else []
-        if isinstance(children, list):
-            for child in children:
-                _create_tree(child, node.id)
-        return True
-
-    created = 0
-    for parent in raw_parents:
-        if _create_tree(parent, None):
-            created += 1
-
-    if not created:
+    trees = [report.tree for report in reports if report.valid]
+    if not trees:
         return render_materials_page(
             request,
             user,
             db,
             error="Aucun parent valide à importer.",
+            import_report=reports,
         )
+    insert_import_trees(db, trees)
+    bump_catalog_version(db)
     db.commit()
+    if any(not report.valid for report in reports):
+        return render_materials_page(request, user, db, import_report=reports)
     return RedirectResponse("/materials", status_code=303)
 
 
@@ -1641,31 +1832,14 @@ def materials_parents_duplicate(
             error="Le parent à dupliquer est introuvable.",
         )
 
-    def _clone_subtree(node: MaterialTemplate, parent_id: int) -> None:
-        for child in node.children:
-            child_expected = child.expected_qty if child.node_type == "item" else None
-            clone = MaterialTemplate(
-                name=child.name,
-                node_type=child.node_type,
-                expected_qty=child_expected,
-                parent_id=parent_id,
-            )
-            db.add(clone)
-            db.flush()
-            if child.node_type == "container":
-                _clone_subtree(child, clone.id)
-
-    root_expected = source.expected_qty if source.node_type == "item" else None
-    root = MaterialTemplate(
-        name=new_name,
-        node_type=source.node_type,
-        expected_qty=root_expected,
-        parent_id=None,
+    clone_subtrees(
+        db,
+        MaterialTemplate,
+        [source.id],
+        TEMPLATE_CLONE_COLUMNS,
+        root_values={source.id: {"name": new_name}},
     )
-    db.add(root)
-    db.flush()
-    if source.node_type == "container":
-        _clone_subtree(source, root.id)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/materials", status_code=303)
 
@@ -1679,17 +1853,8 @@ def materials_delete(
     material = db.get(MaterialTemplate, material_id)
     if not material:
         raise HTTPException(status_code=404, detail="Item introuvable")
-
-    def delete_descendants(node_id: int) -> None:
-        children = db.scalars(
-            select(MaterialTemplate).where(MaterialTemplate.parent_id == node_id)
-        ).all()
-        for child in children:
-            delete_descendants(child.id)
-            db.delete(child)
-
-    delete_descendants(material.id)
-    db.delete(material)
+    delete_template_subtrees(db, [material.id])
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/materials", status_code=303)
 
@@ -1716,6 +1881,7 @@ def lot_create(
     lot = Lot(name=lot_name)
     lot.materials = templates
     db.add(lot)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/lots", status_code=303)
 
@@ -1745,6 +1911,24 @@ def lot_update(
         ).all()
     lot.name = lot_name
     lot.materials = templates
+    bump_catalog_version(db)
+    db.commit()
+    return RedirectResponse("/lots", status_code=303)
+
+
+@app.post("/lots/{lot_id}/duplicate")
+def lot_duplicate(
+    lot_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
+):
+    lot = db.get(Lot, lot_id)
+    if not lot:
+        raise HTTPException(status_code=404, detail="Lot introuvable")
+    copy = Lot(name=f"{lot.name} (copie)"[:120])
+    copy.materials = list(lot.materials)
+    db.add(copy)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/lots", status_code=303)
 
@@ -1770,71 +1954,88 @@ def lot_delete(
             error="Ce lot possède des réservations. Supprimez d'abord ses réservations manuelles ou les événements associés.",
         )
     db.delete(lot)
+    bump_catalog_version(db)
     db.commit()
     return RedirectResponse("/lots", status_code=303)
 
 
+def event_archive_clause(cutoff: datetime) -> Any:
+    """Events whose end (or day, without an end) is older than ``cutoff``."""
+    return or_(
+        and_(Event.ends_at.is_not(None), Event.ends_at < cutoff),
+        and_(
+            Event.ends_at.is_(None),
+            Event.date.is_not(None),
+            Event.date < cutoff.date(),
+        ),
+    )
+
+
 @app.get("/events", response_class=HTMLResponse)
 def events_list(
     request: Request,
+    view: str = "active",
+    page: int = 1,
+    q: str = "",
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
     db: Session = Depends(get_db),
 ):
-    events = db.scalars(select(Event)).all()
-    nodes = db.scalars(select(EventNode)).all()
-    nodes_by_event: dict[int, list[EventNode]] = defaultdict(list)
-    for node in nodes:
-        nodes_by_event[node.event_id].append(node)
+    view = "archived" if view == "archived" else "active"
+    search = q.strip()
+    filters = [Event.name.ilike(f"%{search}%")] if search else []
+    archived = event_archive_clause(datetime.now() - timedelta(days=2))
+    total_count, archived_count = db.execute(
+        select(
+            func.count(Event.id),
+            func.coalesce(func.sum(case((archived, 1), else_=0)), 0),
+        ).where(*filters)
+    ).one()
+    active_count = total_count - archived_count
+    view_count = archived_count if view == "archived" else active_count
+    page_count = max(1, -(-view_count // EVENTS_PAGE_SIZE))
+    page = min(max(page, 1), page_count)
+    events = db.scalars(
+        select(Event)
+        .where(*filters, archived if view == "archived" else ~archived)
+        .order_by(
+            func.coalesce(Event.starts_at, Event.date, Event.created_at).desc(),
+            Event.id.desc(),
+        )
+        .limit(EVENTS_PAGE_SIZE)
+        .offset((page - 1) * EVENTS_PAGE_SIZE)
+    ).all()
+    summaries = event_progress_summaries(db, [event.id for event in events])
 
     event_cards = []
-    archive_cutoff = datetime.now() - timedelta(days=2)
     for event in events:
-        event_nodes = nodes_by_event.get(event.id, [])
-        progress = compute_progress(event_nodes)
-        last_update = max(
-            (node.updated_at for node in event_nodes if node.updated_at),
-            default=None,
-        )
+        progress = summaries[event.id]["progress"]
         state = derive_event_state(event, progress)
-        event_reference = event.ends_at
-        if not event_reference and event.date:
-            event_reference = datetime.combine(event.date, datetime_time.max)
-        is_archived = bool(event_reference and event_reference < archive_cutoff)
         event_cards.append(
             {
                 "event": event,
                 "progress": progress,
                 "date_label": format_date(event.date, "Date inconnue"),
-                "last_update_label": format_date(last_update, "Aucune mise à jour"),
+                "last_update_label": format_date(
+                    summaries[event.id]["last_update"], "Aucune mise à jour"
+                ),
                 "state_label": state["label"],
                 "state_class": state["class"],
                 "state": state["state"],
-                "is_archived": is_archived,
+                "is_archived": view == "archived",
             }
         )
-    event_cards.sort(
-        key=lambda item: (
-            item["event"].starts_at
-            or (
-                datetime.combine(item["event"].date, datetime_time.min)
-                if item["event"].date
-                else item["event"].created_at
-            )
-        ),
-        reverse=True,
-    )
     return templates.TemplateResponse(
         "events.html",
         {
             "request": request,
             "user": user,
             "event_cards": event_cards,
-            "active_count": len(
-                [item for item in event_cards if not item["is_archived"]]
-            ),
-            "archived_count": len(
-                [item for item in event_cards if item["is_archived"]]
-            ),
+            "view": view,
+            "search": search,
+            "page": page,
+            "page_count": page_count,
+            "active_count": active_count,
+            "archived_count": archived_count,
         },
     )
 
@@ -1848,78 +2049,21 @@ def event_new_form(
     return render_event_new_page(request, user, db)
 
 
-def load_event_template_data(db: Session) -> tuple[list[MaterialTemplate], list[Lot], dict[int, str], list[dict[str, Any]]]:
-    templates_list = db.scalars(
-        select(MaterialTemplate).where(MaterialTemplate.parent_id.is_(None))
-    ).all()
-    templates_list.sort(key=lambda item: item.name.lower())
-    lots = db.scalars(select(Lot).options(selectinload(Lot.materials))).all()
-    lots.sort(key=lambda item: item.name.lower())
-    template_index = {template.id: template.name for template in templates_list}
-    lot_payload = [
-        {
-            "id": lot.id,
-            "name": lot.name,
-            "color": get_lot_color(lot),
-            "template_ids": [
-                material.id
-                for material in sorted(lot.materials, key=lambda item: item.name.lower())
-                if material.parent_id is None
-            ],
-        }
-        for lot in lots
-    ]
-    return templates_list, lots, template_index, lot_payload
-
-
 def render_event_new_page(
     request: Request,
     user: User,
     db: Session,
     error: str | None = None,
 ) -> HTMLResponse:
-    templates_list, lots, template_index, lot_payload = load_event_template_data(db)
-    assigned_template_ids: set[int] = set()
-    template_groups = []
-    for lot in lots:
-        group_templates = [
-            material
-            for material in sorted(lot.materials, key=lambda item: item.name.lower())
-            if material.parent_id is None and material.id not in assigned_template_ids
-        ]
-        if group_templates:
-            template_groups.append({"label": lot.name, "templates": group_templates})
-            assigned_template_ids.update(
-                material.id for material in group_templates
-            )
-    ungrouped_templates = [
-        template
-        for template in templates_list
-        if template.id not in assigned_template_ids
-    ]
-    if ungrouped_templates:
-        template_groups.append(
-            {"label": "Hors lot", "templates": ungrouped_templates}
-        )
-    template_payload = {
-        str(template.id): {
-            "name": template.name,
-            "type": template.node_type,
-            "max_qty": template.expected_qty,
-        }
-        for template in templates_list
-    }
+    catalog = catalog_cache.get(db)
     return templates.TemplateResponse(
         "event_new.html",
         {
             "request": request,
             "user": user,
-            "templates": templates_list,
-            "lots": lots,
-            "template_index": template_index,
-            "lot_payload": lot_payload,
-            "template_groups": template_groups,
-            "template_payload": template_payload,
+            "templates": catalog.templates,
+            "lots": catalog.lots,
+            "template_groups": catalog.template_groups,
             "error": error,
         },
     )
@@ -1960,10 +2104,12 @@ def event_create(
         raw_quantities = {}
     copied_template_ids: set[int] = set()
     copy_plan: list[dict[str, Any]] = []
+    plan_templates: dict[int, MaterialTemplate] = {}
     all_lots = db.scalars(
         select(Lot).options(selectinload(Lot.materials)).order_by(Lot.name)
     ).all()
     lots_by_id = {lot.id: lot for lot in all_lots}
+    lots_by_template = template_lot_index(all_lots)
     explicit_lot_ids = set(lot_ids)
     lots: list[Lot] = []
     if lot_ids:
@@ -1992,6 +2138,7 @@ def event_create(
                 if material.parent_id is not None or material.id in copied_template_ids:
                     continue
                 copied_template_ids.add(material.id)
+                plan_templates[material.id] = material
                 copy_plan.append(
                     {
                         "template_id": material.id,
@@ -2023,14 +2170,9 @@ def event_create(
         if template_id in copied_template_ids:
             continue
         copied_template_ids.add(template_id)
-        source_lot = next(
-            (
-                lot
-                for lot in all_lots
-                if any(material.id == template_id for material in lot.materials)
-            ),
-            None,
-        )
+        plan_templates[template_id] = selected_templates_by_id[template_id]
+        source_lots = lots_by_template.get(template_id)
+        source_lot = source_lots[0] if source_lots else None
         copy_plan.append(
             {
                 "template_id": template_id,
@@ -2048,9 +2190,7 @@ def event_create(
     requested_template_quantities: dict[int, int] = {}
     copy_templates: dict[int, MaterialTemplate] = {}
     for plan_item in copy_plan:
-        template = db.get(MaterialTemplate, plan_item["template_id"])
-        if not template:
-            continue
+        template = plan_templates[plan_item["template_id"]]
         copy_templates[template.id] = template
         capacity = (
             template.expected_qty
@@ -2070,51 +2210,27 @@ def event_create(
                 error=f"Quantité invalide pour « {template.name} ».",
             )
         requested_template_quantities[template.id] = parsed_qty
-    existing_template_reservations = find_template_reservations(
-        db,
-        list(requested_template_quantities),
-        start_value,
-        end_value,
+    quantity_error = template_quantity_error(
+        db, requested_template_quantities, copy_templates, start_value, end_value
     )
-    already_reserved: dict[int, int] = defaultdict(int)
-    for reservation in existing_template_reservations:
-        already_reserved[reservation.template_id] += reservation.quantity
-    for template_id, requested_qty in requested_template_quantities.items():
-        template = copy_templates[template_id]
-        capacity = (
-            template.expected_qty
-            if template.node_type == "item" and template.expected_qty
-            else 1
-        )
-        remaining = max(0, capacity - already_reserved[template_id])
-        if requested_qty > remaining:
-            return render_event_new_page(
-                request,
-                user,
-                db,
-                error=f"Il ne reste que {remaining} disponible(s) pour « {template.name} » sur ce créneau.",
-            )
+    if quantity_error:
+        return render_event_new_page(request, user, db, error=quantity_error)
     impacted_lots: dict[int, set[str] | None] = {
         lot.id: None for lot in lots
     }
     for template in selected_templates:
-        if any(
-            any(material.id == template.id for material in lot.materials)
-            for lot in lots
-        ):
+        template_lots = lots_by_template.get(template.id, [])
+        if any(lot.id in explicit_lot_ids for lot in template_lots):
             continue
-        for lot in all_lots:
-            if lot.id in explicit_lot_ids:
-                continue
-            if any(material.id == template.id for material in lot.materials):
-                reserved_items = impacted_lots.setdefault(lot.id, set())
-                if reserved_items is not None:
-                    quantity = requested_template_quantities.get(template.id)
-                    reserved_items.add(
-                        f"{template.name} × {quantity}"
-                        if quantity is not None
-                        else template.name
-                    )
+        for lot in template_lots:
+            reserved_items = impacted_lots.setdefault(lot.id, set())
+            if reserved_items is not None:
+                quantity = requested_template_quantities.get(template.id)
+                reserved_items.add(
+                    f"{template.name} × {quantity}"
+                    if quantity is not None
+                    else template.name
+                )
     impacted_conflicts = find_lot_conflicts(
         db,
         [
@@ -2175,23 +2291,25 @@ def event_create(
                 ends_at=end_value,
             )
         )
-    for sort_order, plan_item in enumerate(copy_plan):
-        root_template = db.get(MaterialTemplate, plan_item["template_id"])
-        if root_template:
-            qty_override = (
-                requested_template_quantities.get(root_template.id)
-                if root_template.node_type == "item"
-                else None
-            )
-            copy_template_to_event(
-                db,
-                event.id,
-                root_template,
-                None,
-                lot=plan_item["lot"],
-                sort_order=sort_order,
-                expected_qty_override=qty_override,
-            )
+    copy_templates_to_event(
+        db,
+        event.id,
+        [
+            {
+                "template_id": plan_item["template_id"],
+                "lot": plan_item["lot"],
+                "sort_order": sort_order,
+                "expected_qty": (
+                    requested_template_quantities.get(plan_item["template_id"])
+                    if copy_templates[plan_item["template_id"]].node_type == "item"
+                    else None
+                ),
+            }
+            for sort_order, plan_item in enumerate(copy_plan)
+        ],
+    )
+    refresh_event_rollups(db, event.id)
+    bump_reservations_version(db)
     db.commit()
     return RedirectResponse("/events", status_code=303)
 
@@ -2203,6 +2321,17 @@ def event_detail(
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
     db: Session = Depends(get_db),
 ):
+    return render_event_detail_page(request, user, db, event_id)
+
+
+def render_event_detail_page(
+    request: Request,
+    user: User,
+    db: Session,
+    event_id: int,
+    error: str | None = None,
+    status_code: int = 200,
+) -> HTMLResponse:
     context = build_event_detail_payload(event_id, db)
     event = context["event"]
     event.date_label = format_date(event.date)
@@ -2217,15 +2346,24 @@ def event_detail(
     event.completed_label = format_date(event.verification_completed_at, "En attente")
     context["request"] = request
     context["user"] = user
-    return templates.TemplateResponse("event_detail.html", context)
+    context["error"] = error
+    return templates.TemplateResponse("event_detail.html", context, status_code=status_code)
 
 
 @app.get("/events/{event_id}/live")
 def event_detail_live(
+    request: Request,
     event_id: int,
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
     db: Session = Depends(get_db),
 ):
+    revision = db.scalar(select(Event.revision).where(Event.id == event_id))
+    if revision is None:
+        raise HTTPException(status_code=404)
+    etag = event_live_etag(event_id, revision)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
     context = build_event_detail_payload(event_id, db)
     parent_summary_html = templates.get_template(
         "partials/event_detail_parent_summary.html"
@@ -2238,7 +2376,9 @@ def event_detail_live(
             "tree_html": tree_html,
             "restock_html": restock_html,
             "progress": context["progress"],
-        }
+            "revision": revision,
+        },
+        headers=headers,
     )
 
 
@@ -2252,30 +2392,7 @@ def render_event_materials_page(
 ) -> HTMLResponse:
     tree = build_tree(nodes)
     containers = [node for node in nodes if node.node_type == "container"]
-    templates_list = db.scalars(
-        select(MaterialTemplate).where(MaterialTemplate.parent_id.is_(None))
-    ).all()
-    templates_list.sort(key=lambda item: item.name.lower())
-    template_choices = [
-        {
-            "id": template.id,
-            "label": template.name,
-            "node_type": template.node_type,
-        }
-        for template in templates_list
-    ]
-    template_choices.sort(key=lambda item: item["label"].lower())
-    lots = db.scalars(select(Lot).options(selectinload(Lot.materials))).all()
-    lots.sort(key=lambda item: item.name.lower())
-    lot_choices = [
-        {
-            "id": lot.id,
-            "label": lot.name,
-            "color": get_lot_color(lot),
-            "count": len([material for material in lot.materials if material.parent_id is None]),
-        }
-        for lot in lots
-    ]
+    catalog = catalog_cache.get(db)
     parent_cards = [
         {
             "node": branch["node"],
@@ -2293,8 +2410,8 @@ def render_event_materials_page(
             "event": event,
             "tree": tree,
             "containers": containers,
-            "material_templates": template_choices,
-            "lots": lot_choices,
+            "material_templates": catalog.template_choices,
+            "lots": catalog.lot_choices,
             "parent_cards": parent_cards,
             "error": error,
         },
@@ -2365,7 +2482,11 @@ def event_materials_add(
         sort_order=get_next_event_sort_order(db, event_id),
     )
     db.add(new_node)
+    assign_path(db, new_node)
+    seq = bump_event_revision(db, event_id)
+    refresh_event_rollups(db, event_id)
     db.commit()
+    notify_event_structure(event_id, seq)
     return RedirectResponse(f"/events/{event_id}/materials", status_code=303)
 
 
@@ -2491,14 +2612,21 @@ def event_materials_add_from_template(
                     ends_at=event.ends_at,
                 )
             )
-    copy_template_to_event(
+    copy_templates_to_event(
         db,
         event.id,
-        template,
-        None,
-        sort_order=get_next_event_sort_order(db, event_id),
+        [
+            {
+                "template_id": template.id,
+                "sort_order": get_next_event_sort_order(db, event_id),
+            }
+        ],
     )
+    seq = bump_event_revision(db, event_id)
+    refresh_event_rollups(db, event_id)
+    bump_reservations_version(db)
     db.commit()
+    notify_event_structure(event_id, seq)
     return RedirectResponse(f"/events/{event_id}/materials", status_code=303)
 
 
@@ -2618,16 +2746,21 @@ def event_materials_add_from_lot(
                     )
                 )
     sort_order = get_next_event_sort_order(db, event_id)
-    for offset, template in enumerate(sorted(root_templates, key=lambda item: item.name.lower())):
-        copy_template_to_event(
-            db,
-            event.id,
-            template,
-            None,
-            lot=lot,
-            sort_order=sort_order + offset,
-        )
+    copy_templates_to_event(
+        db,
+        event.id,
+        [
+            {"template_id": template.id, "lot": lot, "sort_order": sort_order + offset}
+            for offset, template in enumerate(
+                sorted(root_templates, key=lambda item: item.name.lower())
+            )
+        ],
+    )
+    seq = bump_event_revision(db, event_id)
+    refresh_event_rollups(db, event_id)
+    bump_reservations_version(db)
     db.commit()
+    notify_event_structure(event_id, seq)
     return RedirectResponse(f"/events/{event_id}/materials", status_code=303)
 
 
@@ -2641,16 +2774,11 @@ def event_materials_delete(
     node = db.get(EventNode, node_id)
     if not node or node.event_id != event_id:
         raise HTTPException(status_code=404, detail="Item introuvable")
-
-    def delete_descendants(node_id: int) -> None:
-        children = db.scalars(select(EventNode).where(EventNode.parent_id == node_id)).all()
-        for child in children:
-            delete_descendants(child.id)
-            db.delete(child)
-
-    delete_descendants(node.id)
-    db.delete(node)
+    seq = bump_event_revision(db, event_id)
+    delete_event_node_subtrees(db, [node.id])
+    refresh_event_rollups(db, event_id)
     db.commit()
+    notify_event_structure(event_id, seq)
     return RedirectResponse(f"/events/{event_id}/materials", status_code=303)
 
 
@@ -2743,9 +2871,11 @@ def event_node_load(
         )
     node.load_vehicle = vehicle
     db.add(node)
+    seq = bump_event_revision(db, event_id)
     db.commit()
     payload = {
         "type": "load",
+        "seq": seq,
         "node_id": node.id,
         "vehicle": node.load_vehicle,
         "loaded": node.loaded_at is not None,
@@ -2777,25 +2907,18 @@ def event_node_charge(
             status_code=400,
             detail="Le chargement est réservé aux contenants.",
         )
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    status_lookup = build_status_lookup(build_tree(nodes))
-    if status_lookup.get(node.id) != "ok":
-        raise HTTPException(
-            status_code=400,
-            detail="Le sac doit être validé OK avant le chargement.",
-        )
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    status_lookup = build_status_lookup(build_tree(nodes))
-    if status_lookup.get(node.id) != "ok":
+    if node.rollup_status != "ok":
         raise HTTPException(
             status_code=400,
             detail="Le sac doit être validé OK avant le chargement.",
         )
     node.loaded_at = datetime.utcnow()
     db.add(node)
+    seq = bump_event_revision(db, event_id)
     db.commit()
     payload = {
         "type": "load",
+        "seq": seq,
         "node_id": node.id,
         "vehicle": node.load_vehicle,
         "loaded": node.loaded_at is not None,
@@ -2825,53 +2948,42 @@ def event_node_bulk_ok(
         raise HTTPException(status_code=404)
     if node.node_type not in {"container", "item"}:
         raise HTTPException(status_code=400, detail="Type de noeud non supporté.")
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    nodes_by_parent: dict[int | None, list[EventNode]] = defaultdict(list)
-    for entry in nodes:
-        nodes_by_parent[entry.parent_id].append(entry)
-
     items: list[EventNode] = []
 
     if node.node_type == "item":
         items = [node]
     else:
-        def collect_items(parent_id: int) -> None:
-            for child in nodes_by_parent.get(parent_id, []):
-                if child.node_type == "item":
-                    items.append(child)
-                else:
-                    collect_items(child.id)
-
-        collect_items(node.id)
+        items = subtree_nodes(db, EventNode, node, EventNode.node_type == "item")
         if not items:
             items = [node]
     verifier_name = user.username if user else ""
     now = datetime.utcnow()
+    # Locks the event row first so the completion flag sees concurrent ticks.
+    seq = bump_event_revision(db, event_id)
     for item in items:
         item.status = "ok"
         item.comment = None
         item.last_verifier_name = verifier_name or item.last_verifier_name
         item.updated_at = now
         db.add(item)
-    if not event.verification_started_at:
-        event.verification_started_at = now
-    db.add(event)
-    db.commit()
-
-    progress = compute_progress(nodes)
-    if progress["total"] and progress["pending"] == 0:
-        event.verification_completed_at = now
-    else:
-        event.verification_completed_at = None
-    db.add(event)
-    db.commit()
-
     updated_nodes = [
-        {"id": item.id, "status": item.status, "verifier_name": item.last_verifier_name}
+        {
+            "id": item.id,
+            "status": item.status,
+            "comment": "",
+            "verifier_name": item.last_verifier_name or "",
+        }
         for item in items
     ]
+    updated_ids = [entry["id"] for entry in updated_nodes]
+    propagate_rollups(db, updated_ids)
+    progress = locked_event_progress(db, event_id)
+    mark_verification_progress(event, progress, now)
+    db.commit()
+
     payload = {
         "type": "bulk",
+        "seq": seq,
         "node_id": node.id,
         "updated_nodes": updated_nodes,
         "progress": progress,
@@ -2879,19 +2991,7 @@ def event_node_bulk_ok(
     try:
         import anyio
 
-        for item in items:
-            anyio.from_thread.run(
-                manager.broadcast,
-                event_id,
-                {
-                    "type": "progress",
-                    "progress": progress,
-                    "node_id": item.id,
-                    "status": item.status,
-                    "comment": item.comment or "",
-                    "verifier_name": item.last_verifier_name or "",
-                },
-            )
+        anyio.from_thread.run(manager.broadcast, event_id, payload)
     except RuntimeError:
         pass
     accepts = request.headers.get("accept", "")
@@ -2918,29 +3018,20 @@ def event_node_reset(
     if node.node_type not in {"container", "item"}:
         raise HTTPException(status_code=400, detail="Type de noeud non supporté.")
 
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    nodes_by_parent: dict[int | None, list[EventNode]] = defaultdict(list)
-    for entry in nodes:
-        nodes_by_parent[entry.parent_id].append(entry)
-
     items: list[EventNode] = []
     containers: list[EventNode] = []
     if node.node_type == "item":
         items = [node]
     else:
-        containers.append(node)
-
-        def collect_descendants(parent_id: int) -> None:
-            for child in nodes_by_parent.get(parent_id, []):
-                if child.node_type == "item":
-                    items.append(child)
-                else:
-                    containers.append(child)
-                    collect_descendants(child.id)
-
-        collect_descendants(node.id)
+        for entry in subtree_nodes(db, EventNode, node):
+            if entry.node_type == "item":
+                items.append(entry)
+            else:
+                containers.append(entry)
 
     now = datetime.utcnow()
+    # Event row first, then nodes: the same lock order as every other writer.
+    seq = bump_event_revision(db, event_id)
     for item in items:
         item.status = None
         item.comment = None
@@ -2955,25 +3046,22 @@ def event_node_reset(
         container.loaded_at = None
         container.load_vehicle = None
         db.add(container)
+    item_ids = [item.id for item in items]
+    container_ids = [container.id for container in containers]
+    propagate_rollups(db, [*item_ids, *container_ids])
+    progress = locked_event_progress(db, event_id)
     event.verification_completed_at = None
     db.add(event)
     db.commit()
-
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    progress = compute_progress(nodes)
     payload = {
         "type": "reset",
-        "node_id": node.id,
-        "updated_nodes": [{"id": item.id, "status": "pending"} for item in items],
-        "reset_containers": [{"id": container.id} for container in containers],
+        "seq": seq,
+        "node_id": node_id,
+        "updated_nodes": [{"id": item_id, "status": "pending"} for item_id in item_ids],
+        "reset_containers": [{"id": container_id} for container_id in container_ids],
         "progress": progress,
     }
-    try:
-        import anyio
-
-        anyio.from_thread.run(manager.broadcast, event_id, payload)
-    except RuntimeError:
-        pass
+    manager.broadcast_nowait(event_id, payload)
     accepts = request.headers.get("accept", "")
     if "application/json" in accepts:
         return JSONResponse(payload)
@@ -2992,34 +3080,165 @@ def event_close(
         raise HTTPException(status_code=404)
     event.status = "closed"
     db.add(event)
+    seq = bump_event_revision(db, event_id)
     db.commit()
+    notify_event_structure(event_id, seq)
     return RedirectResponse(f"/events/{event_id}", status_code=303)
 
 
-@app.post("/events/{event_id}/delete")
-def event_delete(
+@app.post("/events/{event_id}/duplicate")
+def event_duplicate(
+    request: Request,
     event_id: int,
+    starts_at: str = Form(...),
+    ends_at: str = Form(...),
     db: Session = Depends(get_db),
     user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
 ):
+    """Copy an event's material tree and reservations onto a new time slot.
+
+    The slot goes through the same stock and lot checks as a new event; the
+    copy starts unchecked.
+    """
     event = db.get(Event, event_id)
     if not event:
         raise HTTPException(status_code=404)
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    reservations = db.scalars(
-        select(LotReservation).where(LotReservation.event_id == event_id)
-    ).all()
+    start_value = parse_local_datetime(starts_at)
+    end_value = parse_local_datetime(ends_at)
+    if not start_value or not end_value:
+        return render_event_detail_page(
+            request,
+            user,
+            db,
+            event_id,
+            error="Renseignez la date et les horaires de la copie.",
+            status_code=400,
+        )
+    if end_value <= start_value:
+        return render_event_detail_page(
+            request,
+            user,
+            db,
+            event_id,
+            error="La fin du poste doit être postérieure au début.",
+            status_code=400,
+        )
     template_reservations = db.scalars(
-        select(TemplateReservation).where(TemplateReservation.event_id == event_id)
+        select(TemplateReservation)
+        .options(selectinload(TemplateReservation.template))
+        .where(TemplateReservation.event_id == event_id)
     ).all()
-    for node in nodes:
-        db.delete(node)
-    for reservation in reservations:
-        db.delete(reservation)
+    lot_reservations = db.scalars(
+        select(LotReservation)
+        .where(LotReservation.event_id == event_id)
+        .order_by(LotReservation.id)
+    ).all()
+    quantities: dict[int, int] = defaultdict(int)
+    reserved_templates: dict[int, MaterialTemplate] = {}
     for reservation in template_reservations:
-        db.delete(reservation)
-    db.delete(event)
+        quantities[reservation.template_id] += reservation.quantity
+        reserved_templates[reservation.template_id] = reservation.template
+    quantity_error = template_quantity_error(
+        db, quantities, reserved_templates, start_value, end_value
+    )
+    if quantity_error:
+        return render_event_detail_page(
+            request, user, db, event_id, error=quantity_error, status_code=409
+        )
+    # Whole lots conflict with any reservation, partial ones only with whole.
+    conflicts = find_lot_conflicts(
+        db,
+        [item.lot_id for item in lot_reservations if item.reserved_items is None],
+        start_value,
+        end_value,
+    ) + [
+        conflict
+        for conflict in find_lot_conflicts(
+            db,
+            [item.lot_id for item in lot_reservations if item.reserved_items is not None],
+            start_value,
+            end_value,
+        )
+        if conflict.reserved_items is None
+    ]
+    if conflicts:
+        conflict_names = ", ".join(sorted({conflict.lot.name for conflict in conflicts}))
+        return render_event_detail_page(
+            request,
+            user,
+            db,
+            event_id,
+            error=f"Créneau indisponible pour : {conflict_names}. Consultez le calendrier des lots.",
+            status_code=409,
+        )
+    copy = Event(
+        name=f"{event.name} (copie)"[:120],
+        date=start_value.date(),
+        starts_at=start_value,
+        ends_at=end_value,
+        info=event.info,
+        public_token=secrets.token_urlsafe(24),
+    )
+    db.add(copy)
+    db.flush()
+    for template_id, quantity in quantities.items():
+        db.add(
+            TemplateReservation(
+                template_id=template_id,
+                event_id=copy.id,
+                quantity=quantity,
+                starts_at=start_value,
+                ends_at=end_value,
+            )
+        )
+    for reservation in lot_reservations:
+        db.add(
+            LotReservation(
+                lot_id=reservation.lot_id,
+                event_id=copy.id,
+                title=copy.name,
+                reserved_items=reservation.reserved_items,
+                starts_at=start_value,
+                ends_at=end_value,
+            )
+        )
+    root_ids = db.scalars(
+        select(EventNode.id)
+        .where(EventNode.event_id == event_id, EventNode.parent_id.is_(None))
+        .order_by(EventNode.id)
+    ).all()
+    clone_subtrees(
+        db,
+        EventNode,
+        root_ids,
+        EVENT_NODE_CLONE_COLUMNS,
+        values={"event_id": copy.id},
+    )
+    refresh_event_rollups(db, copy.id)
+    bump_reservations_version(db)
+    db.commit()
+    return RedirectResponse(f"/events/{copy.id}", status_code=303)
+
+
+@app.post("/events/{event_id}/delete")
+def event_delete(
+    event_id: int,
+    db: Session = Depends(get_db),
+    user: User = Depends(require_roles(ROLE_ADMIN, ROLE_CHIEF)),
+):
+    event = db.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=404)
+    for model in (EventNode, LotReservation, TemplateReservation):
+        db.execute(
+            delete(model)
+            .where(model.event_id == event_id)
+            .execution_options(synchronize_session=False)
+        )
+    db.execute(delete(Event).where(Event.id == event_id))
+    bump_reservations_version(db)
     db.commit()
+    notify_event_structure(event_id)
     return RedirectResponse("/events", status_code=303)
 
 
@@ -3051,7 +3270,18 @@ def public_start(
     event.verifier_name = cleaned_name or event.verifier_name
     event.verification_started_at = datetime.utcnow()
     db.add(event)
+    seq = bump_event_revision(db, event_id)
     db.commit()
+    try:
+        import anyio
+
+        anyio.from_thread.run(
+            manager.broadcast,
+            event_id,
+            {"type": "event", "seq": seq, "verifier_name": event.verifier_name or ""},
+        )
+    except RuntimeError:
+        pass
     response = RedirectResponse(f"/public/{event_id}/{token}/check", status_code=303)
     if cleaned_name:
         response.set_cookie(
@@ -3118,9 +3348,11 @@ def public_restock(
     event = db.get(Event, event_id)
     if not event or event.public_token != token:
         raise HTTPException(status_code=404)
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    progress = compute_progress(nodes)
+    # Locks the event row so the completion check cannot race a reset.
+    seq = bump_event_revision(db, event_id)
+    progress = locked_event_progress(db, event_id)
     if progress["total"] and progress["pending"] > 0:
+        db.rollback()
         raise HTTPException(
             status_code=400,
             detail="Le réassort est disponible une fois la checklist terminée.",
@@ -3149,18 +3381,14 @@ def public_restock(
     db.commit()
     payload = {
         "type": "restock",
+        "seq": seq,
         "node_id": parent.id,
         "node_name": parent.name,
         "note": parent.restock_note,
         "author": parent.restock_author,
         "updated_label": format_date(parent.restock_updated_at, ""),
     }
-    try:
-        import anyio
-
-        anyio.from_thread.run(manager.broadcast, event_id, payload)
-    except RuntimeError:
-        pass
+    manager.broadcast_nowait(event_id, payload)
     accepts = request.headers.get("accept", "")
     if "application/json" in accepts:
         return JSONResponse(payload)
@@ -3182,53 +3410,39 @@ def public_node_bulk_ok(
     if not node or node.event_id != event_id or node.node_type != "container":
         raise HTTPException(status_code=404)
 
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    nodes_by_parent: dict[int | None, list[EventNode]] = defaultdict(list)
-    for entry in nodes:
-        nodes_by_parent[entry.parent_id].append(entry)
-
-    items: list[EventNode] = []
-
-    def collect_items(parent_id: int) -> None:
-        for child in nodes_by_parent.get(parent_id, []):
-            if child.node_type == "item":
-                items.append(child)
-            else:
-                collect_items(child.id)
-
-    collect_items(node.id)
+    items = subtree_nodes(db, EventNode, node, EventNode.node_type == "item")
     if not items:
         items = [node]
     verifier_value = (
         (request.cookies.get("verifier_name") or event.verifier_name or "").strip()
     )
     now = datetime.utcnow()
+    # Locks the event row first so the completion flag sees concurrent ticks.
+    seq = bump_event_revision(db, event_id)
     for item in items:
         item.status = "ok"
         item.comment = None
         item.last_verifier_name = verifier_value or item.last_verifier_name
         item.updated_at = now
         db.add(item)
-    if not event.verification_started_at:
-        event.verification_started_at = now
-    db.add(event)
-    db.commit()
-
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    progress = compute_progress(nodes)
-    if progress["total"] and progress["pending"] == 0:
-        event.verification_completed_at = now
-    else:
-        event.verification_completed_at = None
-    db.add(event)
-    db.commit()
-
     updated_nodes = [
-        {"id": item.id, "status": item.status, "verifier_name": item.last_verifier_name}
+        {
+            "id": item.id,
+            "status": item.status,
+            "comment": "",
+            "verifier_name": item.last_verifier_name or "",
+        }
         for item in items
     ]
+    updated_ids = [entry["id"] for entry in updated_nodes]
+    propagate_rollups(db, updated_ids)
+    progress = locked_event_progress(db, event_id)
+    mark_verification_progress(event, progress, now)
+    db.commit()
+
     payload = {
         "type": "bulk",
+        "seq": seq,
         "node_id": node.id,
         "updated_nodes": updated_nodes,
         "progress": progress,
@@ -3237,19 +3451,7 @@ def public_node_bulk_ok(
     try:
         import anyio
 
-        for item in items:
-            anyio.from_thread.run(
-                manager.broadcast,
-                event_id,
-                {
-                    "type": "progress",
-                    "progress": progress,
-                    "node_id": item.id,
-                    "status": item.status,
-                    "comment": item.comment or "",
-                    "verifier_name": item.last_verifier_name or "",
-                },
-            )
+        anyio.from_thread.run(manager.broadcast, event_id, payload)
     except RuntimeError:
         pass
     accepts = request.headers.get("accept", "")
@@ -3278,44 +3480,126 @@ def update_item(
     verifier_value = (
         (request.cookies.get("verifier_name") or verifier_name or "").strip()
     )
+    now = datetime.utcnow()
+    # The revision bump locks the event row, so concurrent ticks take turns
+    # and the completion flag is computed from the committed state.
+    seq = bump_event_revision(db, event_id)
     node.status = status
     node.comment = comment or None
     if verifier_value:
         node.last_verifier_name = verifier_value
         event.verifier_name = verifier_value
-    node.updated_at = datetime.utcnow()
-    db.add(node)
-    db.commit()
-    nodes = db.scalars(select(EventNode).where(EventNode.event_id == event_id)).all()
-    progress = compute_progress(nodes)
-    if not event.verification_started_at:
-        event.verification_started_at = datetime.utcnow()
-    if progress["total"] and progress["pending"] == 0:
-        event.verification_completed_at = datetime.utcnow()
-    else:
-        event.verification_completed_at = None
-    db.add(event)
-    db.commit()
+    node.updated_at = now
+    propagate_rollups(db, [node.id])
+    progress = locked_event_progress(db, event_id)
+    mark_verification_progress(event, progress, now)
     manager_payload = {
         "type": "progress",
+        "seq": seq,
         "progress": progress,
         "node_id": node.id,
         "status": node.status,
         "comment": node.comment or "",
         "verifier_name": node.last_verifier_name or "",
     }
-    try:
-        import anyio
-
-        anyio.from_thread.run(manager.broadcast, event_id, manager_payload)
-    except RuntimeError:
-        pass
+    db.commit()
+    manager.broadcast_nowait(event_id, manager_payload)
     accepts = request.headers.get("accept", "")
     if "application/json" in accepts:
         return JSONResponse(manager_payload)
     return RedirectResponse(f"/public/{event_id}/{token}/check", status_code=303)
 
 
+@app.post("/public/{event_id}/{token}/sync")
+def sync_items(
+    request: Request,
+    event_id: int,
+    token: str,
+    data: Any = Body(...),
+    db: Session = Depends(get_db),
+):
+    """Apply the checklist changes a device queued while offline.
+
+    Each node keeps the most recent change (last writer wins); a queued
+    change older than what the server already has comes back as a conflict
+    with the current server state so the device can catch up.
+    """
+    event = db.get(Event, event_id)
+    if not event or event.public_token != token:
+        raise HTTPException(status_code=404)
+    now = datetime.utcnow()
+    try:
+        changes, rejected = parse_sync_changes(data, now)
+    except SyncFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    verifier_value = (
+        request.cookies.get("verifier_name") or str(data.get("verifier_name") or "")
+    ).strip()
+    if changes:
+        # Lock the event row before reading updated_at: last-writer-wins and
+        # the completion flag must not race a concurrent tick on this event.
+        db.execute(select(Event.id).where(Event.id == event_id).with_for_update())
+    nodes = {
+        node.id: node
+        for node in db.scalars(
+            select(EventNode).where(
+                EventNode.event_id == event_id,
+                EventNode.id.in_([change.node_id for change in changes]),
+            )
+        )
+    }
+    applied = []
+    conflicts = []
+    for change in changes:
+        node = nodes.get(change.node_id)
+        if not node or node.node_type != "item":
+            rejected.append({"node_id": change.node_id, "reason": "unknown"})
+            continue
+        if node.updated_at and node.updated_at > change.changed_at:
+            conflicts.append(
+                {
+                    "id": node.id,
+                    "status": node.status or "pending",
+                    "comment": node.comment or "",
+                    "verifier_name": node.last_verifier_name or "",
+                }
+            )
+            continue
+        node.status = change.status
+        node.comment = change.comment
+        if verifier_value:
+            node.last_verifier_name = verifier_value
+        node.updated_at = change.changed_at
+        applied.append(node)
+    payload = {
+        "type": "bulk",
+        "seq": event.revision,
+        "updated_nodes": [
+            {
+                "id": node.id,
+                "status": node.status or "pending",
+                "comment": node.comment or "",
+                "verifier_name": node.last_verifier_name or "",
+            }
+            for node in applied
+        ],
+        "verifier_name": verifier_value,
+    }
+    if applied:
+        payload["seq"] = bump_event_revision(db, event_id)
+        if verifier_value:
+            event.verifier_name = verifier_value
+        propagate_rollups(db, [node.id for node in applied])
+        payload["progress"] = locked_event_progress(db, event_id)
+        mark_verification_progress(event, payload["progress"], now)
+        db.commit()
+        manager.broadcast_nowait(event_id, payload)
+    else:
+        db.rollback()
+        payload["progress"] = locked_event_progress(db, event_id)
+    return JSONResponse({**payload, "conflicts": conflicts, "rejected": rejected})
+
+
 @app.get("/stock/issues", response_class=HTMLResponse)
 def stock_issues(
     request: Request,
@@ -3367,55 +3651,59 @@ def stock_issue_delete(
     issue = db.get(EventNode, node_id)
     if not issue or issue.status != "problem":
         return RedirectResponse("/stock/issues", status_code=303)
+    event_id = issue.event_id
+    now = datetime.utcnow()
+    if event_id:
+        # Event row first, then nodes: the same lock order as every other writer.
+        seq = bump_event_revision(db, event_id)
     issue.status = None
     issue.comment = None
-    issue.updated_at = datetime.utcnow()
+    issue.updated_at = now
     db.add(issue)
-    if issue.event_id:
-        nodes = db.scalars(
-            select(EventNode).where(EventNode.event_id == issue.event_id)
-        ).all()
-        progress = compute_progress(nodes)
-        event = issue.event
+    propagate_rollups(db, [issue.id])
+    payload = None
+    if event_id:
+        progress = locked_event_progress(db, event_id)
+        event = db.get(Event, event_id)
         if event:
-            if progress["total"] and progress["pending"] == 0:
-                event.verification_completed_at = datetime.utcnow()
-            else:
-                event.verification_completed_at = None
-            db.add(event)
+            mark_verification_progress(event, progress, now)
+        payload = {
+            "type": "progress",
+            "seq": seq,
+            "node_id": node_id,
+            "status": "pending",
+            "comment": "",
+            "progress": progress,
+        }
     db.commit()
+    if payload:
+        manager.broadcast_nowait(event_id, payload)
     return RedirectResponse("/stock/issues", status_code=303)
 
 
+def load_event_revision(event_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.scalar(select(Event.revision).where(Event.id == event_id)) or 0
+    finally:
+        db.close()
+
+
 @app.websocket("/ws/events/{event_id}")
-async def websocket_event(websocket: WebSocket, event_id: int):
-    await manager.connect(event_id, websocket)
+async def websocket_event(websocket: WebSocket, event_id: int, since: int | None = None):
+    revision = None
+    if since is not None:
+        revision = await run_in_threadpool(load_event_revision, event_id)
+    await manager.connect(event_id, websocket, since, revision)
     try:
         while True:
             await websocket.receive_text()
-    except WebSocketDisconnect:
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
         manager.disconnect(event_id, websocket)
 
 
-LOT_COLORS = [
-    "#2563eb",
-    "#16a34a",
-    "#dc2626",
-    "#9333ea",
-    "#0891b2",
-    "#ca8a04",
-    "#db2777",
-    "#475569",
-]
-
-
-def get_lot_color(lot: Lot | None) -> str | None:
-    if not lot:
-        return None
-    seed = lot.id or sum(ord(char) for char in lot.name)
-    return LOT_COLORS[seed % len(LOT_COLORS)]
-
-
 def get_next_event_sort_order(db: Session, event_id: int) -> int:
     existing = db.scalars(
         select(EventNode).where(
@@ -3436,35 +3724,103 @@ def get_next_event_sort_order(db: Session, event_id: int) -> int:
     return 0
 
 
-def copy_template_to_event(
-    db: Session,
-    event_id: int,
-    template: MaterialTemplate,
-    parent_id: int | None,
-    lot: Lot | None = None,
-    sort_order: int | None = None,
-    expected_qty_override: int | None = None,
+def load_template_forest(db: Session, root_ids: list[int]) -> list[Any]:
+    """Rows of the given templates and all their descendants."""
+    paths = subtree_paths(db, MaterialTemplate, root_ids)
+    if not paths:
+        return []
+    return db.execute(
+        select(
+            MaterialTemplate.id,
+            MaterialTemplate.parent_id,
+            MaterialTemplate.name,
+            MaterialTemplate.node_type,
+            MaterialTemplate.expected_qty,
+        ).where(subtree_clause(MaterialTemplate, paths))
+    ).all()
+
+
+def copy_templates_to_event(
+    db: Session, event_id: int, roots: list[dict[str, Any]]
 ) -> None:
-    is_root = parent_id is None
-    node = EventNode(
-        event_id=event_id,
-        name=template.name,
-        node_type=template.node_type,
-        expected_qty=(
-            expected_qty_override
-            if is_root and expected_qty_override is not None
-            else template.expected_qty
-        ),
-        parent_id=parent_id,
-        source_lot_id=lot.id if is_root and lot else None,
-        source_lot_name=lot.name if is_root and lot else None,
-        source_lot_color=get_lot_color(lot) if is_root and lot else None,
-        sort_order=sort_order if is_root else None,
-    )
-    db.add(node)
-    db.flush()
-    for child in sorted(template.children, key=lambda item: item.name.lower()):
-        copy_template_to_event(db, event_id, child, node.id)
+    """Instantiate template trees as event nodes, one multi-row INSERT per level.
+
+    Each root is a dict with ``template_id`` and optional ``lot``,
+    ``sort_order`` and ``expected_qty`` (override for the root only).
+    """
+    if not roots:
+        return
+    rows_by_id = {
+        row.id: row
+        for row in load_template_forest(db, [root["template_id"] for root in roots])
+    }
+    children_by_parent: dict[int, list[Any]] = defaultdict(list)
+    for row in rows_by_id.values():
+        if row.parent_id is not None:
+            children_by_parent[row.parent_id].append(row)
+    for children in children_by_parent.values():
+        children.sort(key=lambda item: item.name.lower())
+
+    level: list[tuple[Any, str | None, dict[str, Any]]] = []
+    for root in roots:
+        template = rows_by_id.get(root["template_id"])
+        if not template:
+            continue
+        lot = root.get("lot")
+        expected_qty = root.get("expected_qty")
+        level.append(
+            (
+                template,
+                None,
+                {
+                    "event_id": event_id,
+                    "name": template.name,
+                    "node_type": template.node_type,
+                    "expected_qty": (
+                        expected_qty if expected_qty is not None else template.expected_qty
+                    ),
+                    "parent_id": None,
+                    "source_lot_id": lot.id if lot else None,
+                    "source_lot_name": lot.name if lot else None,
+                    "source_lot_color": get_lot_color(lot),
+                    "sort_order": root.get("sort_order"),
+                },
+            )
+        )
+    while level:
+        node_ids = db.scalars(
+            insert(EventNode).returning(EventNode.id, sort_by_parameter_order=True),
+            [values for _template, _parent_path, values in level],
+        ).all()
+        paths = [
+            node_path(parent_path, node_id)
+            for (_template, parent_path, _values), node_id in zip(level, node_ids)
+        ]
+        db.execute(
+            update(EventNode),
+            [{"id": node_id, "path": path} for node_id, path in zip(node_ids, paths)],
+        )
+        next_level = []
+        for (template, _parent_path, _values), node_id, path in zip(level, node_ids, paths):
+            for child in children_by_parent.get(template.id, []):
+                next_level.append(
+                    (
+                        child,
+                        path,
+                        {
+                            "event_id": event_id,
+                            "name": child.name,
+                            "node_type": child.node_type,
+                            "expected_qty": child.expected_qty,
+                            "parent_id": node_id,
+                            "source_lot_id": None,
+                            "source_lot_name": None,
+                            "source_lot_color": None,
+                            "sort_order": None,
+                        },
+                    )
+                )
+        level = next_level
 
 
 def build_tree(nodes: list[Any]) -> list[dict[str, Any]]:
@@ -3484,8 +3840,12 @@ def build_tree(nodes: list[Any]) -> list[dict[str, Any]]:
         )
         for node in sorted_nodes:
             children = _build(node.id)
-            status = compute_node_status(node, children)
-            counts = compute_node_counts(node, children, status)
+            if getattr(node, "rollup_status", None):
+                status = node.rollup_status
+                counts = rollup_counts(node)
+            else:
+                status = compute_node_status(node, children)
+                counts = compute_node_counts(node, children, status)
             items.append(
                 {
                     "node": node,
@@ -3515,22 +3875,6 @@ def compute_node_status(node: EventNode, children: list[dict[str, Any]]) -> str:
     return "pending"
 
 
-def build_status_lookup(tree: list[dict[str, Any]]) -> dict[int, str]:
-    statuses: dict[int, str] = {}
-
-    def walk(branches: list[dict[str, Any]]) -> None:
-        for branch in branches:
-            node = branch.get("node")
-            if node:
-                statuses[node.id] = branch.get("status", "pending")
-            children = branch.get("children")
-            if children:
-                walk(children)
-
-    walk(tree)
-    return statuses
-
-
 def compute_node_counts(
     node: EventNode, children: list[dict[str, Any]], status: str
 ) -> dict[str, int]:
@@ -1,5 +1,16 @@
 from datetime import datetime
-from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, String, Table, Text
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    Text,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
@@ -41,6 +52,14 @@ class AppSetting(Base):
 
 class MaterialTemplate(Base):
     __tablename__ = "material_templates"
+    # Prefix searches on path need pattern ops under a non-C PostgreSQL collation.
+    __table_args__ = (
+        Index(
+            "ix_material_templates_path",
+            "path",
+            postgresql_ops={"path": "varchar_pattern_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(120), nullable=False)
@@ -49,6 +68,7 @@ class MaterialTemplate(Base):
     parent_id: Mapped[int | None] = mapped_column(
         ForeignKey("material_templates.id"), nullable=True
     )
+    path: Mapped[str | None] = mapped_column(String(1024), nullable=True)
 
     parent = relationship("MaterialTemplate", remote_side=[id], backref="children")
     lots = relationship(
@@ -89,10 +109,18 @@ class Event(Base):
         DateTime, nullable=True
     )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    revision: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Checkable nodes (items and leaf containers) by status, kept by delta.
+    checklist_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    checklist_ok: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    checklist_problem: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
 
 class LotReservation(Base):
     __tablename__ = "lot_reservations"
+    __table_args__ = (
+        Index("ix_lot_reservations_lot_period", "lot_id", "starts_at", "ends_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     lot_id: Mapped[int] = mapped_column(ForeignKey("lots.id"), nullable=False)
@@ -109,6 +137,14 @@ class LotReservation(Base):
 
 class TemplateReservation(Base):
     __tablename__ = "template_reservations"
+    __table_args__ = (
+        Index(
+            "ix_template_reservations_template_period",
+            "template_id",
+            "starts_at",
+            "ends_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     template_id: Mapped[int] = mapped_column(
@@ -126,6 +162,23 @@ class TemplateReservation(Base):
 
 class EventNode(Base):
     __tablename__ = "event_nodes"
+    __table_args__ = (
+        Index(
+            "ix_event_nodes_path",
+            "path",
+            postgresql_ops={"path": "varchar_pattern_ops"},
+        ),
+        Index("ix_event_nodes_event_parent", "event_id", "parent_id"),
+        Index("ix_event_nodes_parent", "parent_id"),
+        # Open problems are few; keep them in a partial index for the stock views.
+        Index(
+            "ix_event_nodes_problem",
+            "updated_at",
+            "id",
+            postgresql_where=text("status = 'problem'"),
+            sqlite_where=text("status = 'problem'"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     event_id: Mapped[int] = mapped_column(ForeignKey("events.id"), nullable=False)
@@ -146,6 +199,12 @@ class EventNode(Base):
     restock_author: Mapped[str | None] = mapped_column(String(80), nullable=True)
     restock_updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    rollup_status: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    rollup_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    rollup_ok: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    rollup_problem: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    rollup_pending: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    path: Mapped[str | None] = mapped_column(String(1024), nullable=True)
 
     event = relationship("Event", backref="nodes")
     parent = relationship("EventNode", remote_side=[id], backref="children")
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+SYNC_MAX_CHANGES = 1000
+SYNC_STATUSES = {"ok", "problem", "pending"}
+COMMENT_MAX_LENGTH = 2000
+
+
+class SyncFormatError(ValueError):
+    """The sync body is not a list of checklist changes."""
+
+
+@dataclass
+class SyncChange:
+    node_id: int
+    status: str | None
+    comment: str | None
+    changed_at: datetime
+
+
+def _client_time(value: Any) -> datetime | None:
+    """Client timestamps are epoch milliseconds, as ``Date.now()`` returns."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        return datetime.utcfromtimestamp(value / 1000)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def parse_sync_changes(
+    data: Any, now: datetime
+) -> tuple[list[SyncChange], list[dict[str, Any]]]:
+    """Validate a queued batch and keep the last change of each node.
+
+    ``sent_at`` is the client clock when the batch left the device; the
+    difference with ``now`` corrects every ``client_ts`` for clock skew.
+    Changes are returned in batch order, with the rejected ones apart.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("changes"), list):
+        raise SyncFormatError("Liste « changes » attendue.")
+    raw_changes = data["changes"]
+    if len(raw_changes) > SYNC_MAX_CHANGES:
+        raise SyncFormatError(f"{SYNC_MAX_CHANGES} modifications maximum par envoi.")
+    sent_at = _client_time(data.get("sent_at"))
+    skew = now - sent_at if sent_at else timedelta(0)
+    latest: dict[int, SyncChange] = {}
+    rejected: list[dict[str, Any]] = []
+    for raw in raw_changes:
+        node_id = raw.get("node_id") if isinstance(raw, dict) else None
+        if isinstance(node_id, bool) or not isinstance(node_id, int):
+            rejected.append({"node_id": node_id, "reason": "invalid"})
+            continue
+        status = raw.get("status")
+        comment = raw.get("comment")
+        if status not in SYNC_STATUSES or not isinstance(comment, (str, type(None))):
+            rejected.append({"node_id": node_id, "reason": "invalid"})
+            continue
+        client_ts = _client_time(raw.get("client_ts"))
+        changed_at = min(client_ts + skew, now) if client_ts else now
+        change = SyncChange(
+            node_id=node_id,
+            status=None if status == "pending" else status,
+            comment=(comment or "").strip()[:COMMENT_MAX_LENGTH] or None,
+            changed_at=changed_at,
+        )
+        previous = latest.pop(node_id, None)
+        if previous and previous.changed_at > change.changed_at:
+            change = previous
+        latest[node_id] = change
+    return list(latest.values()), rejected
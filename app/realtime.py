@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, defaultdict, deque
+import contextlib
+import json
+import logging
+import os
+import queue
+import select
+import secrets
+import threading
+from typing import Any
+
+from fastapi import WebSocket
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_DISCONNECT = "disconnect"
+RESYNC_MESSAGE = json.dumps({"type": "resync"}, separators=(",", ":"))
+SLOW_CONSUMER_CLOSE_CODE = 1013
+BROADCAST_CHANNEL = "verifmatos_events"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more.
+NOTIFY_PAYLOAD_LIMIT = 7900
+REPLAY_EVENTS_LIMIT = 256
+PUBLISH_RETRY_SECONDS = 2.0
+
+
+def encode_message(payload: dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, max_queue: int) -> None:
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=max_queue)
+        self.task: asyncio.Task[None] | None = None
+        self.dropped = 0
+
+    def close(self) -> None:
+        """Ask the sender task to stop once its pending messages are out."""
+        with contextlib.suppress(asyncio.QueueFull):
+            self.queue.put_nowait(None)
+            return
+        if self.task:
+            self.task.cancel()
+
+
+class BroadcastBackend:
+    """Carries broadcasts to the other processes serving WebSockets."""
+
+    def start(self, manager: ConnectionManager, loop: asyncio.AbstractEventLoop) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def publish(self, event_id: int, message: str, seq: int | None = None) -> None:
+        pass
+
+
+class MemoryBroadcastBackend(BroadcastBackend):
+    """Single process: local delivery is all there is to do."""
+
+
+class PostgresBroadcastBackend(BroadcastBackend):
+    """Relay broadcasts between workers with PostgreSQL LISTEN/NOTIFY.
+
+    Notifications are sent by a publisher thread and received by a listener
+    thread, each on its own connection, so neither blocks the event loop.
+    Payloads are prefixed with the emitting process id to skip our own
+    messages, which were already delivered locally.
+    """
+
+    def __init__(self, dsn: str, channel: str = BROADCAST_CHANNEL) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self.origin = secrets.token_hex(8)
+        self._outbox: queue.Queue[str | None] = queue.Queue()
+        self._stopping = threading.Event()
+        self._manager: ConnectionManager | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self, manager: ConnectionManager, loop: asyncio.AbstractEventLoop) -> None:
+        self._manager = manager
+        self._loop = loop
+        self._stopping.clear()
+        threading.Thread(target=self._publish_loop, name="broadcast-notify", daemon=True).start()
+        threading.Thread(target=self._listen_loop, name="broadcast-listen", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._outbox.put(None)
+
+    def publish(self, event_id: int, message: str, seq: int | None = None) -> None:
+        prefix = f"{self.origin}:{event_id}:{'' if seq is None else seq}:"
+        payload = prefix + message
+        if len(payload.encode("utf-8")) > NOTIFY_PAYLOAD_LIMIT:
+            payload = f"{self.origin}:{event_id}::{RESYNC_MESSAGE}"
+        self._outbox.put(payload)
+
+    def _connect(self) -> Any:
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def _notify(self, connection: Any, payload: str) -> Any:
+        """Send one NOTIFY, reconnecting once; returns the live connection."""
+        for attempt in range(2):
+            try:
+                if connection is None or connection.closed:
+                    connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+                return connection
+            except Exception as exc:
+                logging.warning("Broadcast NOTIFY failed: %s", exc)
+                with contextlib.suppress(Exception):
+                    connection.close()
+                connection = None
+                if attempt:
+                    raise
+        return connection
+
+    def _publish_loop(self) -> None:
+        connection = None
+        # Events whose update could not be relayed: their viewers on other
+        # workers get a resync once PostgreSQL is reachable again.
+        pending_resync: set[int] = set()
+        while True:
+            try:
+                payload = self._outbox.get(
+                    timeout=PUBLISH_RETRY_SECONDS if pending_resync else None
+                )
+            except queue.Empty:
+                payload = ""
+            if payload is None:
+                break
+            if pending_resync:
+                try:
+                    for event_id in sorted(pending_resync):
+                        connection = self._notify(
+                            connection, f"{self.origin}:{event_id}::{RESYNC_MESSAGE}"
+                        )
+                        pending_resync.discard(event_id)
+                except Exception:
+                    connection = None
+            if not payload:
+                continue
+            event_id = int(payload.split(":", 2)[1])
+            if pending_resync:
+                # Still unreachable: this update is covered by the resync.
+                pending_resync.add(event_id)
+                continue
+            try:
+                connection = self._notify(connection, payload)
+            except Exception:
+                connection = None
+                logging.error("Broadcast for event %s dropped; a resync will follow.", event_id)
+                pending_resync.add(event_id)
+        if connection is not None:
+            with contextlib.suppress(Exception):
+                connection.close()
+
+    def _listen_loop(self) -> None:
+        reconnecting = False
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                if reconnecting:
+                    # Notifications sent while we were away are lost.
+                    self._loop.call_soon_threadsafe(self._manager.resync_all)
+                reconnecting = True
+                while not self._stopping.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._dispatch(connection.notifies.pop(0).payload)
+            except Exception as exc:
+                logging.warning("Broadcast LISTEN connection lost: %s", exc)
+                reconnecting = True
+                self._stopping.wait(2)
+            finally:
+                if connection is not None:
+                    with contextlib.suppress(Exception):
+                        connection.close()
+
+    def _dispatch(self, payload: str) -> None:
+        origin, event_id, seq, message = payload.split(":", 3)
+        if origin == self.origin:
+            return
+        self._loop.call_soon_threadsafe(
+            self._manager.deliver_remote,
+            int(event_id),
+            message,
+            int(seq) if seq else None,
+        )
+
+
+def create_broadcast_backend() -> BroadcastBackend:
+    """Pick the backend from BROADCAST_BACKEND (auto, memory or postgres)."""
+    from app.db import engine
+
+    choice = os.getenv("BROADCAST_BACKEND", "auto").strip().lower()
+    if choice == "memory":
+        return MemoryBroadcastBackend()
+    if engine.dialect.name == "postgresql":
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresBroadcastBackend(dsn, os.getenv("BROADCAST_CHANNEL", BROADCAST_CHANNEL))
+    if choice == "postgres":
+        logging.warning("BROADCAST_BACKEND=postgres requires PostgreSQL; using in-memory broadcasts.")
+    return MemoryBroadcastBackend()
+
+
+class ConnectionManager:
+    """Fan out event updates to the WebSockets of each event.
+
+    Every connection owns a bounded outbound queue drained by its own sender
+    task, so a viewer on a poor network only delays itself. When a queue is
+    full the connection either has its backlog replaced by a single
+    ``resync`` message (``drop``) or is closed (``disconnect``).
+
+    Messages carrying a ``seq`` (the event revision) are also kept in a
+    per-event ring buffer so a reconnecting client can ask for what it
+    missed since the last sequence it saw.
+    """
+
+    def __init__(
+        self,
+        max_queue: int | None = None,
+        overflow_policy: str | None = None,
+        send_timeout: float | None = None,
+        backend: BroadcastBackend | None = None,
+        replay_size: int | None = None,
+    ) -> None:
+        self.max_queue = max_queue or int(os.getenv("WS_QUEUE_SIZE", "64"))
+        policy = (overflow_policy or os.getenv("WS_OVERFLOW_POLICY", OVERFLOW_DROP)).strip().lower()
+        self.overflow_policy = policy if policy in {OVERFLOW_DROP, OVERFLOW_DISCONNECT} else OVERFLOW_DROP
+        self.send_timeout = send_timeout or float(os.getenv("WS_SEND_TIMEOUT", "10"))
+        self.active: dict[int, dict[WebSocket, Connection]] = defaultdict(dict)
+        self.backend = backend or MemoryBroadcastBackend()
+        self.replay_size = replay_size or int(os.getenv("WS_REPLAY_SIZE", "200"))
+        self.history: OrderedDict[int, deque[tuple[int, str]]] = OrderedDict()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.backend.start(self, self.loop)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+    async def connect(
+        self,
+        event_id: int,
+        websocket: WebSocket,
+        since: int | None = None,
+        revision: int | None = None,
+    ) -> None:
+        """Accept a viewer, replaying what it missed after ``since``.
+
+        ``revision`` is the event revision read from the database before
+        connecting; when the buffer cannot cover ``since`` up to the latest
+        known revision, the viewer gets a single resync message instead.
+        """
+        await websocket.accept()
+        connection = Connection(websocket, self.max_queue)
+        connection.task = asyncio.create_task(self._sender(event_id, connection))
+        self.active[event_id][websocket] = connection
+        if since is None:
+            return
+        replay = self.replay(event_id, since, revision or 0)
+        for message in replay if replay is not None else [RESYNC_MESSAGE]:
+            self._enqueue(event_id, connection, message)
+
+    def replay(self, event_id: int, since: int, revision: int = 0) -> list[str] | None:
+        """Messages after ``since`` in order, or None when some are missing."""
+        buffered = sorted(
+            (entry for entry in self.history.get(event_id, ()) if entry[0] > since),
+            key=lambda entry: entry[0],
+        )
+        latest = max([revision, *(seq for seq, _message in buffered)])
+        if latest <= since:
+            return []
+        if [seq for seq, _message in buffered] != list(range(since + 1, latest + 1)):
+            return None
+        if len(buffered) >= self.max_queue:
+            return None
+        return [message for _seq, message in buffered]
+
+    def disconnect(self, event_id: int, websocket: WebSocket) -> None:
+        connection = self._discard(event_id, websocket)
+        if connection:
+            connection.close()
+
+    def connection_count(self, event_id: int) -> int:
+        return len(self.active.get(event_id, {}))
+
+    async def broadcast(self, event_id: int, payload: dict[str, Any]) -> None:
+        self._broadcast(event_id, payload)
+
+    def broadcast_nowait(self, event_id: int, payload: dict[str, Any]) -> None:
+        """Hand a broadcast to the event loop from a worker thread, without waiting."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._broadcast, event_id, payload)
+        except RuntimeError:
+            pass
+
+    def _broadcast(self, event_id: int, payload: dict[str, Any]) -> None:
+        message = encode_message(payload)
+        seq = payload.get("seq")
+        self._remember(event_id, seq, message)
+        self.publish(event_id, message)
+        self.backend.publish(event_id, message, seq)
+
+    def deliver_remote(self, event_id: int, message: str, seq: int | None = None) -> None:
+        self._remember(event_id, seq, message)
+        self.publish(event_id, message)
+
+    def _remember(self, event_id: int, seq: int | None, message: str) -> None:
+        if seq is None:
+            return
+        history = self.history.get(event_id)
+        if history is None:
+            history = self.history[event_id] = deque(maxlen=self.replay_size)
+        self.history.move_to_end(event_id)
+        history.append((seq, message))
+        while len(self.history) > REPLAY_EVENTS_LIMIT:
+            self.history.popitem(last=False)
+
+    def resync_all(self) -> None:
+        for event_id in list(self.active):
+            self.deliver_remote(event_id, RESYNC_MESSAGE)
+
+    def publish(self, event_id: int, message: str) -> None:
+        """Queue an already encoded message for every viewer of an event."""
+        for connection in list(self.active.get(event_id, {}).values()):
+            self._enqueue(event_id, connection, message)
+
+    def _enqueue(self, event_id: int, connection: Connection, message: str) -> None:
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            connection.dropped += 1
+        if self.overflow_policy == OVERFLOW_DISCONNECT:
+            self._discard(event_id, connection.websocket)
+            if connection.task:
+                connection.task.cancel()
+            return
+        while not connection.queue.empty():
+            connection.queue.get_nowait()
+        connection.queue.put_nowait(RESYNC_MESSAGE)
+
+    def _discard(self, event_id: int, websocket: WebSocket) -> Connection | None:
+        connections = self.active.get(event_id)
+        if not connections:
+            return None
+        connection = connections.pop(websocket, None)
+        if not connections:
+            self.active.pop(event_id, None)
+        return connection
+
+    async def _sender(self, event_id: int, connection: Connection) -> None:
+        close_code = 1000
+        try:
+            while True:
+                message = await connection.queue.get()
+                if message is None:
+                    break
+                await asyncio.wait_for(
+                    connection.websocket.send_text(message), self.send_timeout
+                )
+        except asyncio.CancelledError:
+            close_code = SLOW_CONSUMER_CLOSE_CODE
+        except Exception:
+            close_code = SLOW_CONSUMER_CLOSE_CODE
+        finally:
+            self._discard(event_id, connection.websocket)
+            with contextlib.suppress(Exception):
+                await connection.websocket.close(code=close_code)
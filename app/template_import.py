@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import codecs
+from dataclasses import dataclass, field
+import json
+import re
+from typing import Any, BinaryIO, Iterator
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.hierarchy import node_path
+from app.models import MaterialTemplate
+
+READ_CHUNK_SIZE = 64 * 1024
+INSERT_BATCH_SIZE = 500
+NAME_MAX_LENGTH = 120
+NODE_TYPES = {"container", "item"}
+_STRUCTURE_TOKEN = re.compile(r'["{}\[\]]')
+_STRING_TOKEN = re.compile(r'["\\]')
+
+
+class ImportFormatError(ValueError):
+    """The uploaded document is not a parents export."""
+
+
+@dataclass
+class ImportNode:
+    name: str
+    node_type: str
+    expected_qty: int | None
+    children: list[ImportNode] = field(default_factory=list)
+
+
+@dataclass
+class ParentReport:
+    index: int
+    name: str
+    nodes: int = 0
+    errors: list[str] = field(default_factory=list)
+    tree: ImportNode | None = None
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors and self.tree is not None
+
+
+class _JsonStream:
+    """Just enough of a pull parser to walk ``{"parents": [...]}`` lazily.
+
+    The document is read in chunks and each parent is decoded on its own,
+    so the raw upload never has to sit in memory as a single string.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = READ_CHUNK_SIZE) -> None:
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> str | None:
+        if self.eof:
+            return None
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return self.decoder.decode(b"", final=True)
+        return self.decoder.decode(chunk)
+
+    def _fill(self) -> bool:
+        text = self._read()
+        if text is None:
+            return False
+        self.buffer = self.buffer[self.pos :] + text
+        self.pos = 0
+        return True
+
+    def _container_end(self) -> int:
+        """Read until the object or array at ``pos`` is complete.
+
+        The bracket/string state carries over between chunks, so each new
+        chunk is scanned once and the buffer is joined a single time.
+        Returns the offset just past the value in the (rebuilt) buffer.
+        """
+        parts = [self.buffer]
+        depth = 0
+        in_string = False
+        escaped = False
+        consumed = 0
+        text = self.buffer
+        index = self.pos
+        while True:
+            if escaped and text:
+                escaped = False
+                index = 1
+            while True:
+                pattern = _STRING_TOKEN if in_string else _STRUCTURE_TOKEN
+                match = pattern.search(text, index)
+                if match is None:
+                    break
+                char = match.group()
+                index = match.end()
+                if char == "\\":
+                    if index == len(text):
+                        escaped = True
+                        break
+                    index += 1
+                elif char == '"':
+                    in_string = not in_string
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        if len(parts) > 1:
+                            self.buffer = "".join(parts)
+                        return consumed + index
+            if len(parts) == 1 and self.pos:
+                # Drop what was already parsed before buffering more.
+                parts[0] = self.buffer[self.pos :]
+                self.pos = 0
+            consumed += len(parts[-1])
+            text = self._read()
+            if text is None:
+                raise ImportFormatError("JSON invalide : document tronqué.")
+            parts.append(text)
+            index = 0
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ImportFormatError(f"« {char} » attendu.")
+        self.pos += 1
+
+    def value(self) -> Any:
+        if self.peek() in ("{", "["):
+            self._container_end()
+            try:
+                value, end = json.JSONDecoder().raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                raise ImportFormatError(f"JSON invalide : {exc.msg}.") from exc
+            self.pos = end
+            return value
+        while True:
+            try:
+                value, end = json.JSONDecoder().raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                if self._fill():
+                    continue
+                raise ImportFormatError(f"JSON invalide : {exc.msg}.") from exc
+            # A number cut by the chunk boundary decodes fine but too short.
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_import_parents(stream: BinaryIO) -> Iterator[Any]:
+    """Yield the raw parents of an export, accepting a bare list as well."""
+    reader = _JsonStream(stream)
+    first = reader.peek()
+    if first == "[":
+        yield from reader.array_items()
+        return
+    reader.expect("{")
+    found = False
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+        if key == "parents" and reader.peek() == "[":
+            found = True
+            yield from reader.array_items()
+        else:
+            reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+    reader.expect("}")
+    if not found:
+        raise ImportFormatError("Clé « parents » absente.")
+
+
+def _validate_node(data: Any, location: str, errors: list[str]) -> ImportNode | None:
+    if not isinstance(data, dict):
+        errors.append(f"{location} : élément invalide.")
+        return None
+    raw_name = data.get("name")
+    name = raw_name.strip() if isinstance(raw_name, str) else ""
+    if not name:
+        errors.append(f"{location} : nom manquant.")
+    elif len(name) > NAME_MAX_LENGTH:
+        errors.append(f"{location} : nom trop long ({NAME_MAX_LENGTH} caractères max).")
+    label = f"{location} « {name} »" if name else location
+    node_type = data.get("type") or data.get("node_type") or "container"
+    if node_type not in NODE_TYPES:
+        errors.append(f"{label} : type « {node_type} » inconnu.")
+        node_type = "container"
+    qty = data.get("qty")
+    expected_qty = None
+    if node_type == "item" and qty not in (None, ""):
+        try:
+            expected_qty = int(qty)
+        except (TypeError, ValueError):
+            errors.append(f"{label} : quantité invalide.")
+        else:
+            if expected_qty < 0:
+                errors.append(f"{label} : quantité négative.")
+    children = data.get("children") or []
+    if not isinstance(children, list):
+        errors.append(f"{label} : « children » doit être une liste.")
+        children = []
+    if node_type == "item" and children:
+        errors.append(f"{label} : un item ne peut pas contenir d'enfants.")
+        children = []
+    node = ImportNode(name=name, node_type=node_type, expected_qty=expected_qty)
+    for position, child in enumerate(children, start=1):
+        child_node = _validate_node(child, f"{label} › enfant {position}", errors)
+        if child_node:
+            node.children.append(child_node)
+    return node
+
+
+def validate_parent(index: int, data: Any) -> ParentReport:
+    name = data.get("name") if isinstance(data, dict) else None
+    report = ParentReport(index=index, name=str(name or f"Parent {index}"))
+    tree = _validate_node(data, "Racine", report.errors)
+    if tree and not report.errors:
+        report.tree = tree
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            report.nodes += 1
+            pending.extend(node.children)
+    return report
+
+
+def read_import_document(stream: BinaryIO) -> list[ParentReport]:
+    """Parse and validate every parent before anything is written."""
+    return [
+        validate_parent(index, data)
+        for index, data in enumerate(iter_import_parents(stream), start=1)
+    ]
+
+
+def insert_import_trees(db: Session, trees: list[ImportNode]) -> int:
+    """Insert validated trees level by level with multi-row INSERTs."""
+    created = 0
+    level: list[tuple[ImportNode, int | None, str | None]] = [
+        (tree, None, None) for tree in trees
+    ]
+    while level:
+        next_level: list[tuple[ImportNode, int | None, str | None]] = []
+        for start in range(0, len(level), INSERT_BATCH_SIZE):
+            batch = level[start : start + INSERT_BATCH_SIZE]
+            node_ids = db.scalars(
+                insert(MaterialTemplate).returning(
+                    MaterialTemplate.id, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "name": node.name,
+                        "node_type": node.node_type,
+                        "expected_qty": node.expected_qty,
+                        "parent_id": parent_id,
+                    }
+                    for node, parent_id, _parent_path in batch
+                ],
+            ).all()
+            paths = [
+                node_path(parent_path, node_id)
+                for (_node, _parent_id, parent_path), node_id in zip(batch, node_ids)
+            ]
+            db.execute(
+                update(MaterialTemplate),
+                [{"id": node_id, "path": path} for node_id, path in zip(node_ids, paths)],
+            )
+            created += len(node_ids)
+            for (node, _parent_id, _parent_path), node_id, path in zip(
+                batch, node_ids, paths
+            ):
+                next_level.extend((child, node_id, path) for child in node.children)
+        level = next_level
+    return created